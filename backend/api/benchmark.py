@@ -0,0 +1,67 @@
+'''
+Benchmark: encoding a 10k-object catalogue page the old way (isoformat in the
+formatter + json.dumps(default=str)) vs serialization.dumps on the stdlib
+fallback and on orjson. Run with: python benchmark.py [objects]
+'''
+import sys
+import json
+import time
+import random
+import datetime
+from decimal import Decimal
+from typing import Any, Dict, List
+
+import serialization
+from index import format_object_with_broker
+
+
+def synthetic_rows(count: int) -> List[tuple]:
+    rnd = random.Random(42)
+    created = datetime.datetime(2025, 1, 1)
+    return [(
+        i, 7, f'Квартира №{i}, ЖК «Северный»', 'Москва', f'ул. Ленина, д. {i % 200}', 'new_flat',
+        Decimal(f'{rnd.randint(20, 150)}.50'), Decimal(rnd.randint(3, 90) * 1_000_000),
+        Decimal(f'{rnd.randint(5, 30)}.{rnd.randint(0, 9)}'),
+        'Просторная квартира с видом на парк. ' * 8,
+        [f'https://cdn.poehali.dev/objects/{i}_{n}.webp' for n in range(4)],
+        'available', created + datetime.timedelta(minutes=i),
+        7, 'Брокер', 'broker@example.com', 55.75 + i % 100 / 1000, 37.61 + i % 100 / 1000,
+        Decimal('125000.00'), Decimal('15.00'), 80
+    ) for i in range(count)]
+
+
+def legacy_format(row) -> Dict[str, Any]:
+    formatted = format_object_with_broker(row)
+    formatted['createdAt'] = row[12].isoformat() if row[12] else None
+    return formatted
+
+
+def run(label: str, fn, repeat: int = 5) -> None:
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        size = len(fn())
+        timings.append(time.perf_counter() - started)
+    print(f'{label:<16} {min(timings) * 1000:>8.1f} ms  {size / 1024 / 1024:>6.2f} MB')
+
+
+def main() -> None:
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 10_000
+    rows = synthetic_rows(count)
+    print(f'{count} objects')
+
+    run('json default=str', lambda: json.dumps([legacy_format(r) for r in rows], default=str))
+
+    orjson = serialization.orjson
+    serialization.orjson = None
+    run('json fallback', lambda: serialization.dumps([format_object_with_broker(r) for r in rows]))
+    serialization.orjson = orjson
+
+    if orjson is not None:
+        run('orjson', lambda: serialization.dumps([format_object_with_broker(r) for r in rows]))
+    else:
+        print('orjson           not installed')
+
+
+if __name__ == '__main__':
+    main()
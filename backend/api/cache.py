@@ -0,0 +1,135 @@
+'''
+Read-through cache for GET responses. Keys carry the resource's data version
+(see data_versions), so a write anywhere - this function, another warm
+container or the sheet import - makes older entries unreachable; TTL and LRU
+eviction only bound how long and how many of them stay in memory.
+'''
+import os
+import json
+import time
+import threading
+from collections import OrderedDict
+from typing import Dict, Any, Callable, Optional, Tuple
+
+CACHE_TTL = float(os.environ.get('API_CACHE_TTL', '300'))
+CACHE_MAX_ENTRIES = int(os.environ.get('API_CACHE_MAX_ENTRIES', '512'))
+CACHE_REDIS_URL = os.environ.get('API_CACHE_REDIS_URL')
+
+
+class MemoryCache:
+    '''In-process TTL + LRU store, shared by all requests of one warm container'''
+
+    name = 'memory'
+
+    def __init__(self, max_entries: int = CACHE_MAX_ENTRIES, ttl: float = CACHE_TTL):
+        self.max_entries = max(1, max_entries)
+        self.ttl = ttl
+        self._entries: 'OrderedDict[str, Tuple[float, Any]]' = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[Any]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: Any) -> None:
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self, prefix: str = '') -> None:
+        with self._lock:
+            for key in [k for k in self._entries if k.startswith(prefix)]:
+                del self._entries[key]
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class RedisCache:
+    '''Shared store for several containers; needs the redis package, which is not a default dependency'''
+
+    name = 'redis'
+
+    def __init__(self, url: str, ttl: float = CACHE_TTL):
+        import redis
+        self.client = redis.Redis.from_url(url)
+        self.ttl = ttl
+
+    def get(self, key: str) -> Optional[Any]:
+        raw = self.client.get(key)
+        return json.loads(raw) if raw is not None else None
+
+    def set(self, key: str, value: Any) -> None:
+        self.client.set(key, json.dumps(value), ex=max(1, int(self.ttl)))
+
+    def clear(self, prefix: str = '') -> None:
+        keys = list(self.client.scan_iter(match=f'{prefix}*'))
+        if keys:
+            self.client.delete(*keys)
+
+    def __len__(self) -> int:
+        return self.client.dbsize()
+
+
+_backend: Any = None
+_backend_lock = threading.Lock()
+_stats = {'hits': 0, 'misses': 0, 'invalidations': 0}
+
+
+def get_backend() -> Any:
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                _backend = RedisCache(CACHE_REDIS_URL) if CACHE_REDIS_URL else MemoryCache()
+    return _backend
+
+
+def set_backend(backend: Any) -> None:
+    '''Swap the store; anything with get/set/clear/__len__ works'''
+    global _backend
+    with _backend_lock:
+        _backend = backend
+
+
+def cache_key(namespace: str, version: int, params: Dict[str, Any]) -> str:
+    query = '&'.join(f'{k}={params[k]}' for k in sorted(params) if k != 'resource')
+    return f'{namespace}:{version}:{query}'
+
+
+def read_through(namespace: str, version: int, params: Dict[str, Any],
+                 load: Callable[[], Dict[str, Any]]) -> Dict[str, Any]:
+    '''Return the cached response for these params, or build it with load() and keep it if it is a 200'''
+    backend = get_backend()
+    key = cache_key(namespace, version, params)
+    cached = backend.get(key)
+    if cached is not None:
+        _stats['hits'] += 1
+        return dict(cached, headers=dict(cached['headers']))
+    _stats['misses'] += 1
+    response = load()
+    if response.get('statusCode') == 200:
+        backend.set(key, response)
+    return response
+
+
+def invalidate(namespace: str) -> None:
+    _stats['invalidations'] += 1
+    get_backend().clear(f'{namespace}:')
+
+
+def cache_stats() -> Dict[str, Any]:
+    backend = get_backend()
+    lookups = _stats['hits'] + _stats['misses']
+    return dict(_stats, entries=len(backend), backend=backend.name,
+                hit_ratio=round(_stats['hits'] / lookups, 3) if lookups else 0.0)
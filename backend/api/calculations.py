@@ -0,0 +1,72 @@
+'''
+Return metrics for whole result sets in one NumPy pass. The same formulas
+back the stored monthly_income / roi_percent / payback_months columns of
+investment_objects (V0029), so numbers from resource=calculate and from
+sort=roi agree.
+'''
+import re
+from typing import Dict, Any, List, Optional, Sequence
+
+import numpy as np
+
+DEFAULT_TERM_MONTHS = 12
+TERM_NUMBER = re.compile(r'\d+')
+TERM_YEARS = re.compile(r'год|лет', re.IGNORECASE)
+
+
+def deal_term_months(deal_cycle: Optional[str]) -> int:
+    '''"18 мес." -> 18, "2 года" -> 24, empty or unparseable -> 12'''
+    match = TERM_NUMBER.search(deal_cycle or '')
+    if not match:
+        return DEFAULT_TERM_MONTHS
+    return int(match.group()) * (12 if TERM_YEARS.search(deal_cycle) else 1)
+
+
+def calculate_returns(price: Sequence[float], yield_percent: Sequence[float], term_months: Sequence[float],
+                      amount: Optional[Sequence[float]] = None) -> Dict[str, np.ndarray]:
+    '''
+    price, yield_percent (annual), term_months and optionally the invested amount
+    (defaults to price). Returns arrays of monthly_income, total_return, roi_percent
+    (over the term) and payback_months (NaN when the yield is zero).
+    '''
+    price = np.asarray(price, dtype=np.float64)
+    rate = np.asarray(yield_percent, dtype=np.float64) / 100
+    term = np.asarray(term_months, dtype=np.float64)
+    capital = price if amount is None else np.where(np.isnan(np.asarray(amount, dtype=np.float64)),
+                                                    price, np.asarray(amount, dtype=np.float64))
+
+    monthly_income = capital * rate / 12
+    total_return = monthly_income * term
+    with np.errstate(divide='ignore', invalid='ignore'):
+        roi_percent = np.where(capital > 0, total_return / capital * 100, 0.0)
+        payback_months = np.where(rate > 0, np.ceil(1 / rate * 12), np.nan)
+    return {
+        'monthly_income': np.round(monthly_income, 2),
+        'total_return': np.round(total_return, 2),
+        'roi_percent': np.round(roi_percent, 2),
+        'payback_months': payback_months,
+    }
+
+
+def returns_table(items: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    '''Row-wise view of calculate_returns for API responses; items carry price, yield_percent, term_months, amount'''
+    if not items:
+        return []
+    metrics = calculate_returns(
+        [item['price'] for item in items],
+        [item['yield_percent'] for item in items],
+        [item['term_months'] for item in items],
+        [np.nan if item.get('amount') is None else item['amount'] for item in items]
+    )
+    rows = []
+    for i, item in enumerate(items):
+        payback = metrics['payback_months'][i]
+        rows.append(dict(
+            {k: v for k, v in item.items() if k == 'objectId'},
+            monthlyIncome=float(metrics['monthly_income'][i]),
+            totalReturn=float(metrics['total_return'][i]),
+            roiPercent=float(metrics['roi_percent'][i]),
+            paybackMonths=None if np.isnan(payback) else int(payback),
+            termMonths=int(item['term_months'])
+        ))
+    return rows
@@ -0,0 +1,89 @@
+'''
+Content-Encoding negotiation for API responses. Bodies above a size threshold
+are compressed with brotli (when the package is installed) or gzip, whichever
+the client accepts, and returned base64 with isBase64Encoded set.
+'''
+import os
+import gzip
+import time
+import base64
+import threading
+from typing import Dict, Any, Optional
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+COMPRESS_MIN_BYTES = int(os.environ.get('API_COMPRESS_MIN_BYTES', '1024'))
+GZIP_LEVEL = int(os.environ.get('API_GZIP_LEVEL', '6'))
+BROTLI_QUALITY = int(os.environ.get('API_BROTLI_QUALITY', '5'))
+
+_stats_lock = threading.Lock()
+_stats = {'compressed': 0, 'skipped': 0, 'bytes_in': 0, 'bytes_out': 0, 'cpu_ms': 0.0}
+
+
+def negotiate(accept_encoding: Optional[str]) -> Optional[str]:
+    '''Pick br or gzip from an Accept-Encoding header, honouring q=0'''
+    if not accept_encoding:
+        return None
+    accepted = {}
+    for item in accept_encoding.split(','):
+        name, _, params = item.strip().partition(';')
+        quality = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        accepted[name.strip().lower()] = quality
+    for encoding in ('br', 'gzip'):
+        if encoding == 'br' and brotli is None:
+            continue
+        if accepted.get(encoding, accepted.get('*', 0.0)) > 0:
+            return encoding
+    return None
+
+
+def compress_response(response: Dict[str, Any], accept_encoding: Optional[str]) -> Dict[str, Any]:
+    if response.get('isBase64Encoded') or not response.get('body'):
+        return response
+    encoding = negotiate(accept_encoding)
+    raw = response['body'].encode('utf-8')
+    if encoding is None or len(raw) < COMPRESS_MIN_BYTES:
+        with _stats_lock:
+            _stats['skipped'] += 1
+        if len(raw) >= COMPRESS_MIN_BYTES:
+            response = dict(response, headers=dict(response.get('headers') or {}, Vary='Accept-Encoding'))
+        return response
+
+    started = time.process_time()
+    if encoding == 'br':
+        packed = brotli.compress(raw, quality=BROTLI_QUALITY)
+    else:
+        packed = gzip.compress(raw, compresslevel=GZIP_LEVEL, mtime=0)
+    cpu_ms = (time.process_time() - started) * 1000
+
+    with _stats_lock:
+        _stats['compressed'] += 1
+        _stats['bytes_in'] += len(raw)
+        _stats['bytes_out'] += len(packed)
+        _stats['cpu_ms'] += cpu_ms
+
+    headers = dict(response.get('headers') or {})
+    headers['Content-Encoding'] = encoding
+    headers['Vary'] = 'Accept-Encoding'
+    if headers.get('ETag'):
+        # A strong ETag names one exact byte sequence, so each encoding gets its own
+        headers['ETag'] = f"{headers['ETag'][:-1]}-{encoding}\""
+    return dict(response, headers=headers, body=base64.b64encode(packed).decode('ascii'), isBase64Encoded=True)
+
+
+def compression_stats() -> Dict[str, Any]:
+    with _stats_lock:
+        stats = dict(_stats)
+    stats['ratio'] = round(stats['bytes_out'] / stats['bytes_in'], 3) if stats['bytes_in'] else 0.0
+    stats['cpu_ms'] = round(stats['cpu_ms'], 1)
+    stats['encodings'] = ['br', 'gzip'] if brotli is not None else ['gzip']
+    return stats
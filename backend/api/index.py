@@ -1,27 +1,60 @@
 import json
 import os
+import base64
 import psycopg2
 import hashlib
-import hmac
+import math
+import time
+import datetime
+from decimal import Decimal, InvalidOperation
 from typing import Dict, Any, List, Optional
+from db import get_connection, pool_stats, execute, data_versions, bump_data_version, transaction
+from cache import read_through, invalidate, cache_stats
+from serialization import dumps
+from compression import compress_response, compression_stats
+from matching import score_matches
+from calculations import deal_term_months, returns_table
+from passwords import hash_password, verify_password, needs_rehash
+from ratelimit import login_retry_after, rate_limit_stats
+from queries import OBJECT_WITH_BROKER_COLUMNS, INVESTOR_COLUMNS, INVESTOR_SELECT, TIMELINE_EVENTS, TIMELINE_EVENT_JSON
 
-def hash_password(password: str) -> str:
-    return hashlib.sha256(password.encode()).hexdigest()
+OBJECTS_PAGE_SIZE = 100
+OBJECTS_MAX_PAGE_SIZE = 500
+BATCH_MAX_REQUESTS = int(os.environ.get('API_BATCH_MAX_REQUESTS', '20'))
+FAVORITES_MAX_BULK = 500
+INVESTORS_PAGE_SIZE = 100
+INVESTORS_MAX_PAGE_SIZE = 500
+TIMELINE_PAGE_SIZE = 50
+TIMELINE_MAX_PAGE_SIZE = 200
+TIMELINE_EVENT_ERROR = 'timeline events must be objects with action, details and an optional date'
+MATCHES_DEFAULT_TOP_K = 10
+MATCHES_MAX_TOP_K = 50
+CALCULATE_MAX_ITEMS = 1000
+POPULARITY_REFRESH_SECONDS = 300
+SEARCH_MAX_LENGTH = 200
+EARTH_RADIUS_KM = 6371.0
+MAX_RADIUS_KM = 500.0
 
-def verify_password(password: str, password_hash: str) -> bool:
-    return hmac.compare_digest(hash_password(password), password_hash)
+# q= relevance: weighted full-text rank (title > address > description) plus fuzzy address similarity
+SEARCH_RANK = "(ts_rank_cd(o.search_vector, s.query) + word_similarity(s.phrase, o.address))::real"
 
-def escape_sql(value):
-    '''Escape values for Simple Query Protocol'''
-    if value is None:
-        return 'NULL'
-    if isinstance(value, bool):
-        return 'true' if value else 'false'
-    if isinstance(value, (int, float)):
-        return str(value)
-    if isinstance(value, str):
-        return "'" + value.replace("'", "''").replace('\\', '\\\\') + "'"
-    return "'" + str(value).replace("'", "''").replace('\\', '\\\\') + "'"
+# sort -> ORDER BY and the matching keyset condition (row-value comparison, all columns DESC)
+OBJECT_SORTS = {
+    'newest': ('o.created_at DESC, o.id DESC', '(o.created_at, o.id) < (%s::timestamp, %s)'),
+    'popular': ('o.favorites_count DESC, o.views_count DESC, o.id DESC',
+                '(o.favorites_count, o.views_count, o.id) < (%s, %s, %s)'),
+    'relevance': ('rank DESC, o.id DESC', f'({SEARCH_RANK}, o.id) < (%s::real, %s)'),
+    'roi': ('o.roi_percent DESC, o.id DESC', '(o.roi_percent, o.id) < (%s::numeric, %s)'),
+}
+
+# GET resource -> data versions its response is built from (see data_versions)
+CONDITIONAL_RESOURCES = {
+    'objects': ('objects', 'users'),
+    'favorites': ('favorites', 'objects'),
+    'users': ('users',),
+    'investors': ('investors',),
+    'matches': ('objects', 'investors'),
+}
 
 def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     '''
@@ -39,36 +72,196 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             'headers': {
                 'Access-Control-Allow-Origin': '*',
                 'Access-Control-Allow-Methods': 'GET, POST, PUT, DELETE, OPTIONS',
-                'Access-Control-Allow-Headers': 'Content-Type, X-User-Id, X-Auth-Token',
+                'Access-Control-Allow-Headers': 'Content-Type, X-User-Id, X-Auth-Token, If-None-Match',
                 'Access-Control-Max-Age': '86400'
             },
             'body': '',
             'isBase64Encoded': False
         }
     
-    conn = None
-    try:
-        dsn = os.environ.get('DATABASE_URL')
-        conn = psycopg2.connect(dsn)
-        conn.autocommit = True
+    response = route(method, resource, event)
+    return compress_response(response, request_header(event, 'Accept-Encoding'))
+
+
+def route(method: str, resource: str, event: Dict[str, Any]) -> Dict[str, Any]:
+    if resource == 'metrics':
+        return success_response({'pool': pool_stats(), 'cache': cache_stats(), 'compression': compression_stats(),
+                                 'auth_rate_limit': rate_limit_stats()})
+    if resource == 'auth' and method == 'POST':
+        throttled = throttle_auth(event)
+        if throttled:
+            return throttled
+
+    with get_connection() as conn:
         cur = conn.cursor()
-        
-        if resource == 'users':
-            return handle_users(cur, method, event)
-        elif resource == 'objects':
-            return handle_objects(cur, method, event)
-        elif resource == 'favorites':
-            return handle_favorites(cur, method, event)
-        elif resource == 'auth':
-            return handle_auth(cur, method, event)
-        elif resource == 'investors':
-            return handle_investors(cur, method, event)
-        else:
-            return error_response('Resource not found', 404)
-    
-    finally:
-        if conn:
-            conn.close()
+        if resource == 'batch':
+            return handle_batch(cur, method, event)
+        return dispatch(cur, method, resource, event)
+
+
+def dispatch(cur, method: str, resource: str, event: Dict[str, Any]) -> Dict[str, Any]:
+    if method == 'GET' and resource in CONDITIONAL_RESOURCES:
+        return conditional_get(cur, resource, event)
+
+    if resource == 'users':
+        return handle_users(cur, method, event)
+    elif resource == 'objects':
+        return handle_objects(cur, method, event)
+    elif resource == 'favorites':
+        return handle_favorites(cur, method, event)
+    elif resource == 'auth':
+        return handle_auth(cur, method, event)
+    elif resource == 'investors':
+        return handle_investors(cur, method, event)
+    elif resource == 'matches':
+        return handle_matches(cur, method, event)
+    elif resource == 'calculate':
+        return handle_calculate(cur, method, event)
+    else:
+        return error_response('Resource not found', 404)
+
+
+def dispatch_get(cur, resource: str, event: Dict[str, Any]) -> Dict[str, Any]:
+    if resource == 'matches':
+        return handle_matches(cur, 'GET', event)
+    return handle_objects(cur, 'GET', event)
+
+
+def handle_batch(cur, method: str, event: Dict[str, Any]) -> Dict[str, Any]:
+    '''
+    Run several sub-requests on one connection and cursor, in order.
+    Body: {"requests": [{"resource", "method", "params", "body", "headers"}, ...]}
+    Each sub-request succeeds or fails on its own (no shared transaction); the reply is
+    an array of {"status", "headers", "body"} in request order.
+    '''
+    if method != 'POST':
+        return error_response('Method not allowed', 405)
+
+    requests = json.loads(event.get('body') or '{}').get('requests')
+    if not isinstance(requests, list) or not requests:
+        return error_response('requests must be a non-empty list', 400)
+    if len(requests) > BATCH_MAX_REQUESTS:
+        return error_response(f'At most {BATCH_MAX_REQUESTS} requests per batch', 400)
+
+    results = []
+    for item in requests:
+        if not isinstance(item, dict):
+            results.append(batch_result(error_response('Sub-request must be an object', 400)))
+            continue
+        resource = item.get('resource', 'objects')
+        malformed = [key for key in ('params', 'headers', 'body')
+                     if item.get(key) is not None and not isinstance(item[key], dict)]
+        if not isinstance(resource, str) or malformed:
+            problem = ', '.join(malformed) or 'resource'
+            results.append(batch_result(error_response(f'Invalid sub-request: {problem} has the wrong type', 400)))
+            continue
+        if resource in ('batch', 'metrics', 'auth'):
+            results.append(batch_result(error_response(f'{resource} is not allowed inside a batch', 400)))
+            continue
+        sub_event = {
+            'httpMethod': str(item.get('method', 'GET')).upper(),
+            'queryStringParameters': dict(item.get('params') or {}, resource=resource),
+            'body': json.dumps(item['body']) if item.get('body') is not None else '{}',
+            'headers': item.get('headers') or {}
+        }
+        try:
+            response = dispatch(cur, sub_event['httpMethod'], resource, sub_event)
+        except (psycopg2.OperationalError, psycopg2.InterfaceError):
+            raise
+        except psycopg2.Error as e:
+            response = error_response(str(e).strip() or 'Database error', 500)
+        except (ValueError, TypeError, KeyError) as e:
+            response = error_response(f'Invalid request: {e}', 400)
+        results.append(batch_result(response))
+
+    return {
+        'statusCode': 200,
+        'headers': {'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*'},
+        'body': f"[{','.join(results)}]",
+        'isBase64Encoded': False
+    }
+
+
+def batch_result(response: Dict[str, Any]) -> str:
+    '''Sub-response bodies are already JSON, so they are spliced in as-is rather than decoded and re-encoded'''
+    headers = {k: v for k, v in response['headers'].items() if k in ('ETag', 'X-Next-Cursor')}
+    return f'{{"status":{response["statusCode"]},"headers":{dumps(headers)},"body":{response["body"] or "null"}}}'
+
+
+def conditional_get(cur, resource: str, event: Dict[str, Any]) -> Dict[str, Any]:
+    '''
+    Strong ETag from the data versions behind the resource plus the query, so an unchanged
+    refresh is answered 304 after one primary-key lookup, without building the body
+    '''
+    params = event.get('queryStringParameters') or {}
+    versions = data_versions(cur, CONDITIONAL_RESOURCES[resource])
+    if resource == 'objects' and params.get('sort') == 'popular':
+        # Popular order moves with favorites, and with views, which bump no version; re-rank every few minutes
+        versions.update(data_versions(cur, ('favorites',)))
+        versions['popularity'] = int(time.time() // POPULARITY_REFRESH_SECONDS)
+    etag = make_etag(resource, versions, params)
+    matched = matching_etag(event, etag)
+    if matched:
+        return not_modified_response(matched)
+
+    if resource in ('objects', 'matches'):
+        response = read_through(resource, etag, params, lambda: dispatch_get(cur, resource, event))
+    elif resource == 'favorites':
+        response = handle_favorites(cur, 'GET', event)
+    elif resource == 'users':
+        response = handle_users(cur, 'GET', event)
+    else:
+        response = handle_investors(cur, 'GET', event)
+
+    if response['statusCode'] == 200:
+        response['headers'].update(etag_headers(etag, response['headers'].get('Access-Control-Expose-Headers')))
+    return response
+
+
+def make_etag(resource: str, versions: Dict[str, int], params: Dict[str, Any]) -> str:
+    raw = '|'.join([resource] + [f'{k}={versions[k]}' for k in sorted(versions)]
+                   + [f'{k}={params[k]}' for k in sorted(params) if k != 'resource'])
+    return f'"{hashlib.sha256(raw.encode()).hexdigest()[:32]}"'
+
+
+def matching_etag(event: Dict[str, Any], etag: str) -> Optional[str]:
+    '''The If-None-Match entry that still matches etag; compressed copies carry a -gzip/-br suffix'''
+    header = request_header(event, 'If-None-Match')
+    if not header:
+        return None
+    for candidate in (c.strip() for c in header.split(',')):
+        if candidate == '*':
+            return etag
+        tag = candidate[2:] if candidate.startswith('W/') else candidate
+        if tag == etag or tag in (f'{etag[:-1]}-br"', f'{etag[:-1]}-gzip"'):
+            return tag
+    return None
+
+
+def request_header(event: Dict[str, Any], name: str) -> Optional[str]:
+    name = name.lower()
+    for key, value in (event.get('headers') or {}).items():
+        if key.lower() == name:
+            return value
+    return None
+
+
+def etag_headers(etag: str, exposed: Optional[str] = None) -> Dict[str, str]:
+    exposed_names = [name for name in (exposed or '').split(', ') if name and name != 'ETag']
+    return {
+        'ETag': etag,
+        'Cache-Control': 'no-cache',
+        'Access-Control-Expose-Headers': ', '.join(exposed_names + ['ETag'])
+    }
+
+
+def not_modified_response(etag: str) -> Dict[str, Any]:
+    return {
+        'statusCode': 304,
+        'headers': dict(etag_headers(etag), **{'Access-Control-Allow-Origin': '*'}),
+        'body': '',
+        'isBase64Encoded': False
+    }
 
 
 def handle_users(cur, method: str, event: Dict[str, Any]) -> Dict[str, Any]:
@@ -78,8 +271,7 @@ def handle_users(cur, method: str, event: Dict[str, Any]) -> Dict[str, Any]:
         email = params.get('email')
         
         if user_id:
-            query = f"SELECT id, email, name, role, created_at FROM users WHERE id = {escape_sql(int(user_id))}"
-            cur.execute(query)
+            execute(cur, 'user_by_id', (int(user_id),))
             row = cur.fetchone()
             if row:
                 return success_response({
@@ -89,8 +281,7 @@ def handle_users(cur, method: str, event: Dict[str, Any]) -> Dict[str, Any]:
             return error_response('User not found', 404)
         
         elif email:
-            query = f"SELECT id, email, name, role, created_at FROM users WHERE email = {escape_sql(email)}"
-            cur.execute(query)
+            execute(cur, 'user_by_email', (email,))
             row = cur.fetchone()
             if row:
                 return success_response({
@@ -100,7 +291,7 @@ def handle_users(cur, method: str, event: Dict[str, Any]) -> Dict[str, Any]:
             return error_response('User not found', 404)
         
         else:
-            cur.execute("SELECT id, email, name, role, created_at FROM users ORDER BY created_at DESC LIMIT 100")
+            execute(cur, 'users_recent')
             rows = cur.fetchall()
             users = [{
                 'id': r[0], 'email': r[1], 'name': r[2],
@@ -117,16 +308,15 @@ def handle_users(cur, method: str, event: Dict[str, Any]) -> Dict[str, Any]:
         if not email or not name:
             return error_response('Email and name are required', 400)
         
-        query = f"SELECT id FROM users WHERE email = {escape_sql(email)}"
-        cur.execute(query)
+        execute(cur, 'user_id_by_email', (email,))
         existing = cur.fetchone()
         
         if existing:
             return success_response({'id': existing[0], 'message': 'User already exists'})
         
-        query = f"INSERT INTO users (email, name, role) VALUES ({escape_sql(email)}, {escape_sql(name)}, {escape_sql(role)}) RETURNING id, email, name, role, created_at"
-        cur.execute(query)
+        execute(cur, 'user_insert', (email, name, role))
         row = cur.fetchone()
+        bump_data_version(cur, 'users')
         
         return success_response({
             'id': row[0], 'email': row[1], 'name': row[2],
@@ -139,21 +329,26 @@ def handle_users(cur, method: str, event: Dict[str, Any]) -> Dict[str, Any]:
         if not user_id:
             return error_response('User ID required', 400)
         fields = []
+        values = []
         if 'name' in body:
-            fields.append(f"name = {escape_sql(body['name'])}")
+            fields.append("name = %s")
+            values.append(body['name'])
         if 'role' in body:
             allowed_roles = ['investor', 'broker', 'admin', 'manager']
             if body['role'] not in allowed_roles:
                 return error_response('Invalid role', 400)
-            fields.append(f"role = {escape_sql(body['role'])}")
+            fields.append("role = %s")
+            values.append(body['role'])
         if 'notify_new_objects' in body:
-            fields.append(f"notify_new_objects = {escape_sql(body['notify_new_objects'])}")
+            fields.append("notify_new_objects = %s")
+            values.append(bool(body['notify_new_objects']))
         if not fields:
             return error_response('No fields to update', 400)
-        cur.execute(f"UPDATE users SET {', '.join(fields)} WHERE id = {escape_sql(int(user_id))} RETURNING id, email, name, role, created_at")
+        cur.execute(f"UPDATE users SET {', '.join(fields)} WHERE id = %s RETURNING id, email, name, role, created_at", values + [int(user_id)])
         row = cur.fetchone()
         if not row:
             return error_response('User not found', 404)
+        bump_data_version(cur, 'users')
         return success_response({'id': row[0], 'email': row[1], 'name': row[2], 'role': row[3], 'created_at': row[4].isoformat() if row[4] else None})
 
     elif method == 'DELETE':
@@ -161,7 +356,8 @@ def handle_users(cur, method: str, event: Dict[str, Any]) -> Dict[str, Any]:
         user_id = params.get('id')
         if not user_id:
             return error_response('User ID required', 400)
-        cur.execute(f"DELETE FROM users WHERE id = {escape_sql(int(user_id))}")
+        execute(cur, 'user_delete', (int(user_id),))
+        bump_data_version(cur, 'users')
         return success_response({'message': 'Deleted'})
 
     return error_response('Method not allowed', 405)
@@ -170,70 +366,42 @@ def handle_users(cur, method: str, event: Dict[str, Any]) -> Dict[str, Any]:
 def handle_objects(cur, method: str, event: Dict[str, Any]) -> Dict[str, Any]:
     if method == 'GET':
         params = event.get('queryStringParameters') or {}
-        object_id = params.get('id')
-        
-        if object_id:
-            query = f"""
-                SELECT o.id, o.broker_id, o.title, o.city, o.address, o.property_type, o.area, o.price, 
-                       o.yield_percent, o.description, o.images, o.status, o.created_at,
-                       u.id, u.name, u.email
-                FROM investment_objects o
-                LEFT JOIN users u ON o.broker_id = u.id
-                WHERE o.id = {escape_sql(int(object_id))}
-            """
-            cur.execute(query)
-            row = cur.fetchone()
-            if row:
-                return success_response(format_object_with_broker(row))
-            return error_response('Object not found', 404)
-        
-        else:
-            query = """
-                SELECT o.id, o.broker_id, o.title, o.city, o.address, o.property_type, o.area, o.price, 
-                       o.yield_percent, o.description, o.images, o.status, o.created_at,
-                       u.id, u.name, u.email
-                FROM investment_objects o
-                LEFT JOIN users u ON o.broker_id = u.id
-                ORDER BY o.created_at DESC LIMIT 100
-            """
-            cur.execute(query)
-            rows = cur.fetchall()
-            return success_response([format_object_with_broker(r) for r in rows])
+        return get_objects(cur, params)
 
     elif method == 'POST':
+        params = event.get('queryStringParameters') or {}
+        if params.get('action') == 'view':
+            if not params.get('id'):
+                return error_response('Object ID required', 400)
+            execute(cur, 'object_view', (int(params['id']),))
+            row = cur.fetchone()
+            if not row:
+                return error_response('Object not found', 404)
+            return success_response({'viewsCount': row[0]})
+
         body = json.loads(event.get('body', '{}'))
-        images_json = escape_sql(json.dumps(body.get('images', [])))
-        query = f"""
-            INSERT INTO investment_objects (
-                broker_id, title, city, address, property_type, area, price,
-                yield_percent, payback_years, description, images, status
-            ) VALUES (
-                {escape_sql(body.get('broker_id'))},
-                {escape_sql(body.get('title'))},
-                {escape_sql(body.get('city'))},
-                {escape_sql(body.get('address'))},
-                {escape_sql(body.get('property_type', 'flats'))},
-                {escape_sql(body.get('area', 0))},
-                {escape_sql(body.get('price', 0))},
-                {escape_sql(body.get('yield_percent', 0))},
-                {escape_sql(body.get('payback_years', 0))},
-                {escape_sql(body.get('description', ''))},
-                ARRAY(SELECT json_array_elements_text({images_json}::json)),
-                {escape_sql(body.get('status', 'available'))}
-            ) RETURNING id
-        """
-        cur.execute(query)
-        row = cur.fetchone()
-        new_id = row[0]
-
-        cur.execute(f"""
-            SELECT o.id, o.broker_id, o.title, o.city, o.address, o.property_type, o.area, o.price, 
-                   o.yield_percent, o.description, o.images, o.status, o.created_at,
-                   u.id, u.name, u.email
-            FROM investment_objects o
-            LEFT JOIN users u ON o.broker_id = u.id
-            WHERE o.id = {escape_sql(new_id)}
-        """)
+        coordinates = parse_coordinates(body)
+        if coordinates is None:
+            return error_response('latitude and longitude must be given together and be valid degrees', 400)
+        execute(cur, 'object_insert', (
+            body.get('broker_id'),
+            body.get('title'),
+            body.get('city'),
+            body.get('address'),
+            body.get('property_type', 'flats'),
+            body.get('area', 0),
+            body.get('price', 0),
+            body.get('yield_percent', 0),
+            body.get('payback_years', 0),
+            body.get('description', ''),
+            json.dumps(body.get('images', [])),
+            body.get('status', 'available'),
+            *coordinates
+        ))
+        new_id = cur.fetchone()[0]
+        objects_changed(cur)
+
+        execute(cur, 'object_by_id', (new_id,))
         return success_response(format_object_with_broker(cur.fetchone()), 201)
 
     elif method == 'PUT':
@@ -242,32 +410,28 @@ def handle_objects(cur, method: str, event: Dict[str, Any]) -> Dict[str, Any]:
         if not object_id:
             return error_response('Object ID required', 400)
 
-        images_json = escape_sql(json.dumps(body.get('images', [])))
-        query = f"""
-            UPDATE investment_objects SET
-                title = {escape_sql(body.get('title'))},
-                city = {escape_sql(body.get('city'))},
-                address = {escape_sql(body.get('address'))},
-                property_type = {escape_sql(body.get('property_type'))},
-                area = {escape_sql(body.get('area'))},
-                price = {escape_sql(body.get('price'))},
-                yield_percent = {escape_sql(body.get('yield_percent'))},
-                payback_years = {escape_sql(body.get('payback_years'))},
-                description = {escape_sql(body.get('description'))},
-                images = ARRAY(SELECT json_array_elements_text({images_json}::json)),
-                status = {escape_sql(body.get('status'))}
-            WHERE id = {escape_sql(int(object_id))}
-        """
-        cur.execute(query)
-
-        cur.execute(f"""
-            SELECT o.id, o.broker_id, o.title, o.city, o.address, o.property_type, o.area, o.price, 
-                   o.yield_percent, o.description, o.images, o.status, o.created_at,
-                   u.id, u.name, u.email
-            FROM investment_objects o
-            LEFT JOIN users u ON o.broker_id = u.id
-            WHERE o.id = {escape_sql(int(object_id))}
-        """)
+        coordinates = parse_coordinates(body)
+        if coordinates is None:
+            return error_response('latitude and longitude must be given together and be valid degrees', 400)
+
+        execute(cur, 'object_update', (
+            int(object_id),
+            body.get('title'),
+            body.get('city'),
+            body.get('address'),
+            body.get('property_type'),
+            body.get('area'),
+            body.get('price'),
+            body.get('yield_percent'),
+            body.get('payback_years'),
+            body.get('description'),
+            json.dumps(body.get('images', [])),
+            body.get('status'),
+            *coordinates
+        ))
+        objects_changed(cur)
+
+        execute(cur, 'object_by_id', (int(object_id),))
         return success_response(format_object_with_broker(cur.fetchone()))
 
     elif method == 'DELETE':
@@ -275,12 +439,208 @@ def handle_objects(cur, method: str, event: Dict[str, Any]) -> Dict[str, Any]:
         object_id = params.get('id')
         if not object_id:
             return error_response('Object ID required', 400)
-        cur.execute(f"DELETE FROM investment_objects WHERE id = {escape_sql(int(object_id))}")
+        execute(cur, 'object_delete', (int(object_id),))
+        objects_changed(cur)
         return success_response({'message': 'Deleted'})
 
     return error_response('Method not allowed', 405)
 
 
+def parse_coordinates(body: Dict[str, Any]) -> Optional[tuple]:
+    '''(latitude, longitude) from a request body; (None, None) when both are absent, None when invalid'''
+    latitude, longitude = body.get('latitude'), body.get('longitude')
+    if latitude in (None, '') and longitude in (None, ''):
+        return None, None
+    try:
+        latitude, longitude = float(latitude), float(longitude)
+    except (TypeError, ValueError):
+        return None
+    if not (-90 <= latitude <= 90 and -180 <= longitude <= 180):
+        return None
+    return latitude, longitude
+
+
+def get_objects(cur, params: Dict[str, Any]) -> Dict[str, Any]:
+    object_id = params.get('id')
+    if object_id:
+        execute(cur, 'object_by_id', (int(object_id),))
+        row = cur.fetchone()
+        if row:
+            return success_response(format_object_with_broker(row))
+        return error_response('Object not found', 404)
+    return list_objects(cur, params)
+
+
+def objects_changed(cur) -> None:
+    '''Other containers drop their cached pages via the version bump; this one frees them right away'''
+    bump_data_version(cur, 'objects')
+    invalidate('objects')
+
+
+def list_objects(cur, params: Dict[str, Any]) -> Dict[str, Any]:
+    '''
+    Keyset page over (created_at, id) DESC, or with sort=popular over the stored
+    (favorites_count, views_count, id) DESC; filters map onto the idx_objects_* indexes.
+    q= matches search_vector (GIN) or the address by trigrams and defaults to sort=relevance.
+    '''
+    try:
+        limit = min(max(int(params.get('limit', OBJECTS_PAGE_SIZE)), 1), OBJECTS_MAX_PAGE_SIZE)
+    except ValueError:
+        return error_response('Invalid limit', 400)
+    phrase = (params.get('q') or '').strip()[:SEARCH_MAX_LENGTH]
+    sort = params.get('sort') or ('relevance' if phrase else 'newest')
+    if sort not in OBJECT_SORTS:
+        return error_response(f"sort must be one of: {', '.join(OBJECT_SORTS)}", 400)
+    if sort == 'relevance' and not phrase:
+        return error_response('sort=relevance needs q', 400)
+    order_by, after_cursor = OBJECT_SORTS[sort]
+
+    conditions = []
+    values: List[Any] = []
+    search_join = ''
+    search_values: List[Any] = []
+    if phrase:
+        search_join = "CROSS JOIN (SELECT websearch_to_tsquery('russian', %s) AS query, %s::text AS phrase) s"
+        search_values = [phrase, phrase]
+        conditions.append("(o.search_vector @@ s.query OR s.phrase <%% o.address)")
+
+    area = geo_conditions(params)
+    if isinstance(area, str):
+        return error_response(area, 400)
+    for condition, condition_values in area:
+        conditions.append(condition)
+        values.extend(condition_values)
+    for key in ('city', 'property_type', 'status'):
+        # Comma-separated values select any of them (multi-select filters in the catalogue)
+        choices = [v.strip() for v in (params.get(key) or '').split(',') if v.strip()]
+        if choices:
+            conditions.append(f"o.{key} = ANY(%s)")
+            values.append(choices)
+    for key, column, op in (('min_price', 'price', '>='), ('max_price', 'price', '<='),
+                            ('min_yield', 'yield_percent', '>='), ('max_yield', 'yield_percent', '<='),
+                            ('min_roi', 'roi_percent', '>=')):
+        if params.get(key) not in (None, ''):
+            try:
+                values.append(float(params[key]))
+                conditions.append(f"o.{column} {op} %s")
+            except ValueError:
+                return error_response(f'Invalid {key}', 400)
+
+    if params.get('cursor'):
+        position = decode_cursor(params['cursor'], sort)
+        if not position:
+            return error_response('Invalid cursor', 400)
+        conditions.append(after_cursor)
+        values.extend(position)
+
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ''
+    cur.execute(f"""
+        SELECT {OBJECT_WITH_BROKER_COLUMNS}, o.favorites_count, o.views_count,
+               {SEARCH_RANK if phrase else 'NULL::real'} AS rank
+        FROM investment_objects o
+        {search_join}
+        LEFT JOIN users u ON o.broker_id = u.id
+        {where}
+        ORDER BY {order_by}
+        LIMIT %s
+    """, search_values + values + [limit + 1])
+    rows = cur.fetchall()
+
+    headers = {}
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        if sort == 'popular':
+            headers['X-Next-Cursor'] = encode_cursor(last[21], last[22], last[0])
+        elif sort == 'relevance':
+            headers['X-Next-Cursor'] = encode_cursor(last[23], last[0])
+        elif sort == 'roi':
+            headers['X-Next-Cursor'] = encode_cursor(last[19], last[0])
+        else:
+            headers['X-Next-Cursor'] = encode_cursor(last[12], last[0])
+    return success_response([format_object_with_broker(r) for r in rows], headers=headers)
+
+
+def geo_conditions(params: Dict[str, Any]):
+    '''
+    WHERE clauses for a map viewport (bbox=minLng,minLat,maxLng,maxLat) and/or a circle
+    (lat, lng, radius_km). Both start with a box test on idx_objects_location (GiST over
+    point(longitude, latitude)); the circle is then trimmed by exact haversine distance.
+    Returns a list of (sql, values) or an error message.
+    '''
+    clauses = []
+    if params.get('bbox'):
+        try:
+            min_lng, min_lat, max_lng, max_lat = (float(v) for v in params['bbox'].split(','))
+        except ValueError:
+            return 'bbox must be minLng,minLat,maxLng,maxLat'
+        if min_lng > max_lng or min_lat > max_lat:
+            return 'bbox must be minLng,minLat,maxLng,maxLat'
+        clauses.append(("point(o.longitude, o.latitude) <@ box(point(%s, %s), point(%s, %s))",
+                        [min_lng, min_lat, max_lng, max_lat]))
+
+    if any(params.get(key) not in (None, '') for key in ('lat', 'lng', 'radius_km')):
+        try:
+            lat, lng, radius = float(params['lat']), float(params['lng']), float(params['radius_km'])
+        except (KeyError, ValueError):
+            return 'lat, lng and radius_km must be numbers'
+        if not (-90 <= lat <= 90 and -180 <= lng <= 180 and 0 < radius <= MAX_RADIUS_KM):
+            return f'lat/lng must be valid degrees and radius_km in (0, {MAX_RADIUS_KM:g}]'
+        lat_delta = math.degrees(radius / EARTH_RADIUS_KM)
+        lng_delta = min(180.0, lat_delta / max(math.cos(math.radians(min(abs(lat) + lat_delta, 90.0))), 1e-6))
+        west, east = lng - lng_delta, lng + lng_delta
+        # A box past the antimeridian is split in two so objects on the far side are not lost
+        if lng_delta >= 180:
+            spans = [(-180.0, 180.0)]
+        elif west < -180:
+            spans = [(-180.0, east), (west + 360, 180.0)]
+        elif east > 180:
+            spans = [(west, 180.0), (-180.0, east - 360)]
+        else:
+            spans = [(west, east)]
+        box_values: List[Any] = []
+        for span_west, span_east in spans:
+            box_values.extend([span_west, lat - lat_delta, span_east, lat + lat_delta])
+        clauses.append(('(' + ' OR '.join(
+            ["point(o.longitude, o.latitude) <@ box(point(%s, %s), point(%s, %s))"] * len(spans)) + ')', box_values))
+        clauses.append((
+            "2 * %s * asin(sqrt(power(sin(radians(o.latitude - %s) / 2), 2) + "
+            "cos(radians(%s)) * cos(radians(o.latitude)) * power(sin(radians(o.longitude - %s) / 2), 2))) <= %s",
+            [EARTH_RADIUS_KM, lat, lat, lng, radius]
+        ))
+    return clauses
+
+
+def encode_cursor(*position) -> str:
+    raw = '|'.join(value.isoformat() if hasattr(value, 'isoformat') else str(value) for value in position)
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(token: str, sort: str = 'newest') -> Optional[tuple]:
+    try:
+        parts = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4)).decode().split('|')
+        if sort == 'popular':
+            favorites_count, views_count, object_id = parts
+            return int(favorites_count), int(views_count), int(object_id)
+        if sort == 'relevance':
+            rank, object_id = parts
+            return float(rank), int(object_id)
+        if sort == 'timeline':
+            event_id, = parts
+            return (int(event_id),)
+        if sort == 'roi':
+            roi, object_id = parts
+            roi = Decimal(roi)
+            if not roi.is_finite():
+                return None
+            return str(roi), int(object_id)
+        created_at, object_id = parts
+        # Validated here so a tampered token is a 400, not a failed ::timestamp cast in Postgres
+        return datetime.datetime.fromisoformat(created_at).isoformat(), int(object_id)
+    except (ValueError, UnicodeDecodeError, InvalidOperation):
+        return None
+
+
 def handle_favorites(cur, method: str, event: Dict[str, Any]) -> Dict[str, Any]:
     if method == 'GET':
         params = event.get('queryStringParameters') or {}
@@ -288,17 +648,19 @@ def handle_favorites(cur, method: str, event: Dict[str, Any]) -> Dict[str, Any]:
         
         if not user_id:
             return error_response('User ID required', 400)
+
+        if params.get('view') == 'ids':
+            # Star states for a catalogue page: only the favorited object ids, optionally within objectIds
+            if params.get('objectIds'):
+                object_ids = parse_ids(params['objectIds'])
+                if object_ids is None:
+                    return error_response(f'objectIds must be up to {FAVORITES_MAX_BULK} integers', 400)
+                execute(cur, 'favorite_ids_in', (int(user_id), object_ids))
+            else:
+                execute(cur, 'favorite_ids_by_user', (int(user_id),))
+            return success_response([r[0] for r in cur.fetchall()])
         
-        query = f"""
-            SELECT f.id, f.user_id, f.object_id, f.created_at,
-                   o.id, o.broker_id, o.title, o.city, o.address, o.property_type, o.area, o.price, 
-                   o.yield_percent, o.description, o.images, o.status, o.created_at
-            FROM favorites f
-            JOIN investment_objects o ON f.object_id = o.id
-            WHERE f.user_id = {escape_sql(int(user_id))}
-            ORDER BY f.created_at DESC
-        """
-        cur.execute(query)
+        execute(cur, 'favorites_by_user', (int(user_id),))
         rows = cur.fetchall()
         
         favorites = []
@@ -322,41 +684,71 @@ def handle_favorites(cur, method: str, event: Dict[str, Any]) -> Dict[str, Any]:
         body = json.loads(event.get('body', '{}'))
         user_id = body.get('userId')
         object_id = body.get('objectId')
+
+        if user_id and 'objectIds' in body:
+            object_ids = parse_ids(body['objectIds'])
+            if object_ids is None:
+                return error_response(f'objectIds must be up to {FAVORITES_MAX_BULK} integers', 400)
+            execute(cur, 'favorites_insert_many', (int(user_id), object_ids))
+            added = sorted(r[0] for r in cur.fetchall())
+            if added:
+                bump_data_version(cur, 'favorites')
+            return success_response({'added': added})
         
         if not user_id or not object_id:
             return error_response('User ID and Object ID required', 400)
         
-        query = f"SELECT id FROM favorites WHERE user_id = {escape_sql(int(user_id))} AND object_id = {escape_sql(int(object_id))}"
-        cur.execute(query)
-        existing = cur.fetchone()
-        
-        if existing:
-            return success_response({'id': existing[0], 'message': 'Already in favorites'})
-        
-        query = f"INSERT INTO favorites (user_id, object_id) VALUES ({escape_sql(int(user_id))}, {escape_sql(int(object_id))}) RETURNING id, user_id, object_id, created_at"
-        cur.execute(query)
+        execute(cur, 'favorite_insert', (int(user_id), int(object_id)))
         row = cur.fetchone()
         
+        if not row:
+            execute(cur, 'favorite_find', (int(user_id), int(object_id)))
+            return success_response({'id': cur.fetchone()[0], 'message': 'Already in favorites'})
+        bump_data_version(cur, 'favorites')
+        
         return success_response({
             'id': row[0], 'userId': row[1], 'objectId': row[2],
             'createdAt': row[3].isoformat() if row[3] else None
         }, 201)
     
     elif method == 'DELETE':
-        body = json.loads(event.get('body', '{}'))
+        body = json.loads(event.get('body') or '{}') or {}
+        params = event.get('queryStringParameters') or {}
         favorite_id = body.get('id')
+        user_id = body.get('userId') or params.get('userId')
+        object_ids = body.get('objectIds') or params.get('objectIds') or body.get('objectId') or params.get('objectId')
+
+        if user_id and object_ids:
+            object_ids = parse_ids(object_ids)
+            if object_ids is None:
+                return error_response(f'objectIds must be up to {FAVORITES_MAX_BULK} integers', 400)
+            execute(cur, 'favorites_delete_many', (int(user_id), object_ids))
+            removed = sorted(r[0] for r in cur.fetchall())
+            if removed:
+                bump_data_version(cur, 'favorites')
+            return success_response({'removed': removed})
         
         if not favorite_id:
             return error_response('Favorite ID required', 400)
         
-        query = f"DELETE FROM favorites WHERE id = {escape_sql(int(favorite_id))}"
-        cur.execute(query)
+        execute(cur, 'favorite_delete', (int(favorite_id),))
+        bump_data_version(cur, 'favorites')
         
         return success_response({'message': 'Favorite removed'})
     
     return error_response('Method not allowed', 405)
 
 
+def parse_ids(value: Any) -> Optional[List[int]]:
+    '''Object ids from a JSON list, a single id or a "1,2,3" query string; None if malformed or too many'''
+    items = value if isinstance(value, list) else str(value).split(',')
+    try:
+        ids = sorted({int(item) for item in items if str(item).strip()})
+    except (TypeError, ValueError):
+        return None
+    return ids if 0 < len(ids) <= FAVORITES_MAX_BULK else None
+
+
 def format_investor(row) -> Dict[str, Any]:
     return {
         'id': str(row[0]),
@@ -366,8 +758,8 @@ def format_investor(row) -> Dict[str, Any]:
         },
         'investmentProfile': {
             'budget': float(row[6]) if row[6] is not None else 0,
-            'strategies': [], 'riskTolerance': 'medium',
-            'preferredPropertyTypes': [], 'preferredLocations': []
+            'strategies': row[16] or [], 'riskTolerance': 'medium',
+            'preferredPropertyTypes': row[17] or [], 'preferredLocations': row[18] or []
         },
         'stage': row[8],
         'interaction': {'source': row[7], 'notes': row[9] or ''},
@@ -378,45 +770,51 @@ def format_investor(row) -> Dict[str, Any]:
             'totalReturn': float(row[13]) if row[13] is not None else 0,
             'properties': []
         },
-        'metadata': {
-            'createdAt': row[14].isoformat() if row[14] else None,
-            'updatedAt': row[15].isoformat() if row[15] else None
-        }
+        'metadata': {'createdAt': row[14], 'updatedAt': row[15]}
     }
 
 
 def handle_investors(cur, method: str, event: Dict[str, Any]) -> Dict[str, Any]:
-    cols = "id, broker_id, first_name, last_name, email, phone, budget, source, stage, notes, timeline, total_invested, active_investments, total_return, created_at, updated_at"
-
     if method == 'GET':
         params = event.get('queryStringParameters') or {}
-        broker_id = params.get('broker_id')
-        if not broker_id:
+        if not params.get('broker_id'):
             return error_response('broker_id required', 400)
-        cur.execute(f"SELECT {cols} FROM broker_investors WHERE broker_id = {escape_sql(int(broker_id))} ORDER BY created_at DESC")
-        rows = cur.fetchall()
-        return success_response([format_investor(r) for r in rows])
+        if params.get('view') == 'stages':
+            return investor_stage_totals(cur, params)
+        if params.get('view') == 'timeline':
+            return investor_timeline_page(cur, params)
+        return list_investors(cur, params)
 
     elif method == 'POST':
+        params = event.get('queryStringParameters') or {}
         body = json.loads(event.get('body', '{}'))
-        timeline = json.dumps(body.get('timeline', []))
-        query = f"""
-            INSERT INTO broker_investors (broker_id, first_name, last_name, email, phone, budget, source, stage, notes, timeline)
-            VALUES (
-                {escape_sql(int(body.get('broker_id')))},
-                {escape_sql(body.get('first_name', ''))},
-                {escape_sql(body.get('last_name', ''))},
-                {escape_sql(body.get('email', ''))},
-                {escape_sql(body.get('phone', ''))},
-                {escape_sql(body.get('budget', 0) or 0)},
-                {escape_sql(body.get('source', ''))},
-                {escape_sql(body.get('stage', 'lead'))},
-                {escape_sql(body.get('notes', ''))},
-                {escape_sql(timeline)}::jsonb
-            ) RETURNING {cols}
-        """
-        cur.execute(query)
-        return success_response(format_investor(cur.fetchone()), 201)
+        if params.get('action') == 'event':
+            return add_investor_event(cur, body)
+
+        timeline = parse_timeline(body.get('timeline') or [])
+        if timeline is None:
+            return error_response(TIMELINE_EVENT_ERROR, 400)
+        execute(cur, 'investor_insert', (
+            int(body.get('broker_id')),
+            body.get('first_name', ''),
+            body.get('last_name', ''),
+            body.get('email', ''),
+            body.get('phone', ''),
+            body.get('budget', 0) or 0,
+            body.get('source', ''),
+            body.get('stage', 'lead'),
+            body.get('notes', ''),
+            [str(v) for v in body.get('strategies') or []],
+            [str(v) for v in body.get('preferred_property_types') or []],
+            [str(v) for v in body.get('preferred_locations') or []]
+        ))
+        row = cur.fetchone()
+        if timeline:
+            append_timeline(cur, row[0], timeline)
+            execute(cur, 'investor_by_id', (row[0],))
+            row = cur.fetchone()
+        bump_data_version(cur, 'investors')
+        return success_response(format_investor(row), 201)
 
     elif method == 'PUT':
         body = json.loads(event.get('body', '{}'))
@@ -424,29 +822,41 @@ def handle_investors(cur, method: str, event: Dict[str, Any]) -> Dict[str, Any]:
         if not investor_id:
             return error_response('Investor ID required', 400)
         fields = []
-        if 'stage' in body:
-            fields.append(f"stage = {escape_sql(body['stage'])}")
-        if 'notes' in body:
-            fields.append(f"notes = {escape_sql(body['notes'])}")
-        if 'timeline' in body:
-            fields.append(f"timeline = {escape_sql(json.dumps(body['timeline']))}::jsonb")
-        if 'first_name' in body:
-            fields.append(f"first_name = {escape_sql(body['first_name'])}")
-        if 'last_name' in body:
-            fields.append(f"last_name = {escape_sql(body['last_name'])}")
-        if 'email' in body:
-            fields.append(f"email = {escape_sql(body['email'])}")
-        if 'phone' in body:
-            fields.append(f"phone = {escape_sql(body['phone'])}")
+        values = []
+        for key in ('stage', 'notes', 'first_name', 'last_name', 'email', 'phone'):
+            if key in body:
+                fields.append(f"{key} = %s")
+                values.append(body[key])
+        for key in ('strategies', 'preferred_property_types', 'preferred_locations'):
+            if key in body:
+                fields.append(f"{key} = %s::text[]")
+                values.append([str(v) for v in body[key] or []])
         if 'budget' in body:
-            fields.append(f"budget = {escape_sql(body['budget'] or 0)}")
-        if not fields:
+            fields.append("budget = %s")
+            values.append(body['budget'] or 0)
+        timeline = parse_timeline(body['timeline']) if 'timeline' in body else []
+        new_event = parse_timeline([body['event']]) if 'event' in body else []
+        if timeline is None or new_event is None:
+            return error_response(TIMELINE_EVENT_ERROR, 400)
+        if not fields and 'timeline' not in body and not new_event:
             return error_response('No fields to update', 400)
+
+        # History is written first so the RETURNING below already includes it; an unknown id inserts nothing.
+        # One transaction, so a failure cannot leave a half-replaced history or events without the update.
         fields.append("updated_at = CURRENT_TIMESTAMP")
-        cur.execute(f"UPDATE broker_investors SET {', '.join(fields)} WHERE id = {escape_sql(int(investor_id))} RETURNING {cols}")
-        row = cur.fetchone()
+        with transaction(cur.connection):
+            if 'timeline' in body:
+                # Legacy full replacement; clients append with event (or action=event) instead
+                execute(cur, 'investor_events_clear', (int(investor_id),))
+                append_timeline(cur, int(investor_id), timeline)
+            if new_event:
+                append_timeline(cur, int(investor_id), new_event)
+            cur.execute(f"UPDATE broker_investors SET {', '.join(fields)} WHERE id = %s RETURNING {INVESTOR_COLUMNS}",
+                        values + [int(investor_id)])
+            row = cur.fetchone()
         if not row:
             return error_response('Investor not found', 404)
+        bump_data_version(cur, 'investors')
         return success_response(format_investor(row))
 
     elif method == 'DELETE':
@@ -454,12 +864,288 @@ def handle_investors(cur, method: str, event: Dict[str, Any]) -> Dict[str, Any]:
         investor_id = params.get('id')
         if not investor_id:
             return error_response('Investor ID required', 400)
-        cur.execute(f"DELETE FROM broker_investors WHERE id = {escape_sql(int(investor_id))}")
+        execute(cur, 'investor_delete', (int(investor_id),))
+        bump_data_version(cur, 'investors')
         return success_response({'message': 'Deleted'})
 
     return error_response('Method not allowed', 405)
 
 
+def investor_filters(params: Dict[str, Any]):
+    '''
+    WHERE clauses shared by the investor listing and the stage totals: broker_id, stage
+    (comma-separated), source, min_budget/max_budget. Returns (conditions, values) or an error message.
+    '''
+    try:
+        conditions, values = ["broker_id = %s"], [int(params['broker_id'])]
+    except ValueError:
+        return 'Invalid broker_id'
+    if params.get('stage'):
+        conditions.append("stage = ANY(%s)")
+        values.append([stage.strip() for stage in params['stage'].split(',') if stage.strip()])
+    if params.get('source'):
+        conditions.append("source = %s")
+        values.append(params['source'])
+    for key, op in (('min_budget', '>='), ('max_budget', '<=')):
+        if params.get(key) not in (None, ''):
+            try:
+                values.append(float(params[key]))
+            except ValueError:
+                return f'Invalid {key}'
+            conditions.append(f"budget {op} %s")
+    return conditions, values
+
+
+def list_investors(cur, params: Dict[str, Any]) -> Dict[str, Any]:
+    '''
+    Ordered by (created_at, id) DESC; with a stage filter it walks idx_broker_investors_funnel.
+    Pages (X-Next-Cursor) only when limit or cursor is given; without them every matching
+    investor is returned, as the funnel expects. timeline=none drops the history,
+    timeline=N keeps only the N latest events.
+    '''
+    paged = bool(params.get('limit') or params.get('cursor'))
+    try:
+        limit = min(max(int(params.get('limit') or INVESTORS_PAGE_SIZE), 1), INVESTORS_MAX_PAGE_SIZE) if paged else None
+    except ValueError:
+        return error_response('Invalid limit', 400)
+
+    timeline = params.get('timeline') or 'full'
+    timeline_values: List[Any] = []
+    if timeline == 'full':
+        timeline_column = TIMELINE_EVENTS
+    elif timeline == 'none':
+        timeline_column = "'[]'::jsonb"
+    elif timeline.isdigit():
+        timeline_column = f"""COALESCE((
+            SELECT jsonb_agg(latest.event ORDER BY latest.id) FROM (
+                SELECT e.id, {TIMELINE_EVENT_JSON} AS event FROM broker_investor_events e
+                WHERE e.investor_id = broker_investors.id ORDER BY e.id DESC LIMIT %s
+            ) latest
+        ), '[]'::jsonb)"""
+        timeline_values.append(int(timeline))
+    else:
+        return error_response('timeline must be full, none or a number of latest events', 400)
+
+    filters = investor_filters(params)
+    if isinstance(filters, str):
+        return error_response(filters, 400)
+    conditions, values = filters
+    if params.get('cursor'):
+        position = decode_cursor(params['cursor'])
+        if not position:
+            return error_response('Invalid cursor', 400)
+        conditions.append("(created_at, id) < (%s::timestamp, %s)")
+        values.extend(position)
+
+    cur.execute(f"""
+        SELECT {INVESTOR_SELECT.format(timeline=timeline_column)}
+        FROM broker_investors
+        WHERE {' AND '.join(conditions)}
+        ORDER BY created_at DESC, id DESC
+        LIMIT %s
+    """, timeline_values + values + [limit + 1 if paged else None])
+    rows = cur.fetchall()
+
+    headers = {}
+    if paged and len(rows) > limit:
+        rows = rows[:limit]
+        headers['X-Next-Cursor'] = encode_cursor(rows[-1][14], rows[-1][0])
+    return success_response([format_investor(r) for r in rows], headers=headers)
+
+
+def parse_timeline(events: Any) -> Optional[List[tuple]]:
+    '''
+    (date, action, details) per {date, action, details} event; None when malformed. Dates are ISO
+    strings in UTC, now when absent; a non-ISO date becomes None and, as in the V0031 backfill,
+    falls back to the investor's created_at in investor_events_append.
+    '''
+    if not isinstance(events, list):
+        return None
+    now = datetime.datetime.now(datetime.timezone.utc)
+    parsed = []
+    for item in events:
+        if not isinstance(item, dict):
+            return None
+        occurred_at = now
+        if item.get('date'):
+            try:
+                occurred_at = datetime.datetime.fromisoformat(str(item['date']).replace('Z', '+00:00'))
+                if occurred_at.tzinfo is None:
+                    occurred_at = occurred_at.replace(tzinfo=datetime.timezone.utc)
+            except ValueError:
+                occurred_at = None
+        parsed.append((occurred_at.isoformat() if occurred_at else None,
+                       str(item.get('action') or ''), str(item.get('details') or '')))
+    return parsed
+
+
+def append_timeline(cur, investor_id: int, events: List[tuple]) -> List[tuple]:
+    '''Inserts events after the investor's existing history; no rows when the investor does not exist'''
+    execute(cur, 'investor_events_append', (
+        investor_id, [e[0] for e in events], [e[1] for e in events], [e[2] for e in events]
+    ))
+    return cur.fetchall()
+
+
+def format_timeline_event(row) -> Dict[str, Any]:
+    return {'id': row[0], 'date': row[1], 'action': row[2], 'details': row[3]}
+
+
+def add_investor_event(cur, body: Dict[str, Any]) -> Dict[str, Any]:
+    '''POST action=event: one insert into broker_investor_events, independent of history length'''
+    investor_id = body.get('investor_id') or body.get('id')
+    if not investor_id:
+        return error_response('Investor ID required', 400)
+    events = parse_timeline([{k: body.get(k) for k in ('date', 'action', 'details')}])
+    if events is None:
+        return error_response(TIMELINE_EVENT_ERROR, 400)
+    rows = append_timeline(cur, int(investor_id), events)
+    if not rows:
+        return error_response('Investor not found', 404)
+    bump_data_version(cur, 'investors')
+    return success_response(format_timeline_event(rows[0]), 201)
+
+
+def investor_timeline_page(cur, params: Dict[str, Any]) -> Dict[str, Any]:
+    '''view=timeline: one investor's events newest first, keyset by event id'''
+    if not params.get('id'):
+        return error_response('Investor ID required', 400)
+    try:
+        limit = min(max(int(params.get('limit', TIMELINE_PAGE_SIZE)), 1), TIMELINE_MAX_PAGE_SIZE)
+    except ValueError:
+        return error_response('Invalid limit', 400)
+    before = (2 ** 63 - 1,)
+    if params.get('cursor'):
+        before = decode_cursor(params['cursor'], 'timeline')
+        if not before:
+            return error_response('Invalid cursor', 400)
+    execute(cur, 'investor_events_page', (int(params['id']), before[0], limit + 1))
+    rows = cur.fetchall()
+
+    headers = {}
+    if len(rows) > limit:
+        rows = rows[:limit]
+        headers['X-Next-Cursor'] = encode_cursor(rows[-1][0])
+    return success_response([format_timeline_event(r) for r in rows], headers=headers)
+
+
+def investor_stage_totals(cur, params: Dict[str, Any]) -> Dict[str, Any]:
+    '''Funnel columns in one GROUP BY: investor count and budget sum per stage, same filters as the listing'''
+    filters = investor_filters(params)
+    if isinstance(filters, str):
+        return error_response(filters, 400)
+    conditions, values = filters
+    cur.execute(f"""
+        SELECT stage, COUNT(*), COALESCE(SUM(budget), 0)
+        FROM broker_investors
+        WHERE {' AND '.join(conditions)}
+        GROUP BY stage
+        ORDER BY stage
+    """, values)
+    stages = [{'stage': r[0], 'count': r[1], 'budget': float(r[2])} for r in cur.fetchall()]
+    return success_response({
+        'stages': stages,
+        'total': {'count': sum(s['count'] for s in stages), 'budget': sum(s['budget'] for s in stages)}
+    })
+
+
+def handle_matches(cur, method: str, event: Dict[str, Any]) -> Dict[str, Any]:
+    '''
+    Top-K available objects for each of a broker's investors, scored in one vectorized pass
+    (see matching.py). GET params: broker_id, optional investor_id, top_k, min_score.
+    Responses are cached until objects or investors change (data versions).
+    '''
+    if method != 'GET':
+        return error_response('Method not allowed', 405)
+    params = event.get('queryStringParameters') or {}
+    broker_id = params.get('broker_id')
+    if not broker_id:
+        return error_response('broker_id required', 400)
+    try:
+        top_k = min(max(int(params.get('top_k', MATCHES_DEFAULT_TOP_K)), 1), MATCHES_MAX_TOP_K)
+        min_score = float(params.get('min_score', 40))
+    except ValueError:
+        return error_response('top_k and min_score must be numbers', 400)
+
+    execute(cur, 'match_investors_by_broker', (int(broker_id),))
+    investors = cur.fetchall()
+    if params.get('investor_id'):
+        investors = [inv for inv in investors if str(inv[0]) == str(params['investor_id'])]
+    execute(cur, 'match_objects_available')
+    objects = cur.fetchall()
+
+    return success_response(score_matches(investors, objects, top_k, min_score))
+
+
+def handle_calculate(cur, method: str, event: Dict[str, Any]) -> Dict[str, Any]:
+    '''
+    ROI, monthly income and payback for a whole set in one vectorized pass (calculations.py).
+    Body: {"objectIds": [...], "amount"?, "term_months"?} for stored objects, or
+    {"items": [{"price", "yield_percent", "term_months" | "deal_cycle", "amount"?}]} for what-if rows.
+    '''
+    if method != 'POST':
+        return error_response('Method not allowed', 405)
+    body = json.loads(event.get('body') or '{}')
+
+    try:
+        if 'objectIds' in body:
+            object_ids = [int(v) for v in body['objectIds']]
+            if not object_ids or len(object_ids) > CALCULATE_MAX_ITEMS:
+                return error_response(f'objectIds must hold 1..{CALCULATE_MAX_ITEMS} ids', 400)
+            execute(cur, 'objects_calc_inputs', (object_ids,))
+            items = [{
+                'objectId': r[0], 'price': float(r[1]), 'yield_percent': float(r[2]),
+                'term_months': float(body['term_months']) if body.get('term_months') else deal_term_months(r[3]),
+                'amount': float(body['amount']) if body.get('amount') else None
+            } for r in cur.fetchall()]
+        else:
+            raw_items = body.get('items')
+            if not isinstance(raw_items, list) or not raw_items or len(raw_items) > CALCULATE_MAX_ITEMS:
+                return error_response(f'items must hold 1..{CALCULATE_MAX_ITEMS} rows', 400)
+            items = [{
+                'price': float(item['price']), 'yield_percent': float(item['yield_percent']),
+                'term_months': float(item['term_months']) if item.get('term_months') else deal_term_months(item.get('deal_cycle')),
+                'amount': float(item['amount']) if item.get('amount') else None
+            } for item in raw_items]
+    except (KeyError, TypeError, ValueError):
+        return error_response('price and yield_percent must be numbers', 400)
+
+    return success_response(returns_table(items))
+
+
+def client_ip(event: Dict[str, Any]) -> Optional[str]:
+    '''
+    The gateway-observed source address. X-Forwarded-For is only a fallback, and then its
+    rightmost hop (appended by our proxy): the leftmost entries are whatever the client sent.
+    '''
+    source_ip = ((event.get('requestContext') or {}).get('identity') or {}).get('sourceIp')
+    if source_ip:
+        return source_ip
+    forwarded = request_header(event, 'X-Forwarded-For')
+    if forwarded:
+        return forwarded.split(',')[-1].strip() or None
+    return None
+
+
+def throttle_auth(event: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    '''429 once the caller's IP or the target email runs out of attempts; decided before any database work'''
+    try:
+        body = json.loads(event.get('body') or '{}')
+    except ValueError:
+        return None
+    if not isinstance(body, dict):
+        return None
+    # change_password/change_email name the account by user_id instead of email
+    account = str(body.get('email') or '').strip().lower() or (f"user:{body['user_id']}" if body.get('user_id') else '')
+    wait = login_retry_after(client_ip(event), account)
+    if not wait:
+        return None
+    response = error_response('Слишком много попыток входа. Попробуйте позже.', 429)
+    response['headers']['Retry-After'] = str(math.ceil(wait))
+    response['headers']['Access-Control-Expose-Headers'] = 'Retry-After'
+    return response
+
+
 def handle_auth(cur, method: str, event: Dict[str, Any]) -> Dict[str, Any]:
     if method != 'POST':
         return error_response('Method not allowed', 405)
@@ -472,7 +1158,7 @@ def handle_auth(cur, method: str, event: Dict[str, Any]) -> Dict[str, Any]:
     if action == 'login':
         if not email or not password:
             return error_response('Email and password required', 400)
-        cur.execute(f"SELECT id, email, name, role, created_at, password_hash FROM users WHERE email = {escape_sql(email)}")
+        execute(cur, 'auth_user_by_email', (email,))
         row = cur.fetchone()
         if not row:
             return error_response('Пользователь не найден', 404)
@@ -481,6 +1167,8 @@ def handle_auth(cur, method: str, event: Dict[str, Any]) -> Dict[str, Any]:
             return error_response('Пароль не установлен. Обратитесь к администратору.', 401)
         if not verify_password(password, stored_hash):
             return error_response('Неверный пароль', 401)
+        if needs_rehash(stored_hash):
+            execute(cur, 'auth_set_password', (row[0], hash_password(password)))
         return success_response({'id': row[0], 'email': row[1], 'name': row[2], 'role': row[3], 'created_at': row[4].isoformat() if row[4] else None})
 
     elif action == 'register':
@@ -490,12 +1178,13 @@ def handle_auth(cur, method: str, event: Dict[str, Any]) -> Dict[str, Any]:
             return error_response('Email, password and name required', 400)
         if role not in ('investor', 'broker'):
             role = 'investor'
-        cur.execute(f"SELECT id FROM users WHERE email = {escape_sql(email)}")
+        execute(cur, 'user_id_by_email', (email,))
         if cur.fetchone():
             return error_response('Пользователь с таким email уже существует', 409)
         ph = hash_password(password)
-        cur.execute(f"INSERT INTO users (email, name, role, password_hash) VALUES ({escape_sql(email)}, {escape_sql(name)}, {escape_sql(role)}, {escape_sql(ph)}) RETURNING id, email, name, role, created_at")
+        execute(cur, 'auth_register', (email, name, role, ph))
         row = cur.fetchone()
+        bump_data_version(cur, 'users')
         return success_response({'id': row[0], 'email': row[1], 'name': row[2], 'role': row[3], 'created_at': row[4].isoformat() if row[4] else None}, 201)
 
     elif action == 'change_password':
@@ -504,14 +1193,14 @@ def handle_auth(cur, method: str, event: Dict[str, Any]) -> Dict[str, Any]:
         new_password = body.get('new_password', '')
         if not user_id or not old_password or not new_password:
             return error_response('user_id, old_password and new_password required', 400)
-        cur.execute(f"SELECT password_hash FROM users WHERE id = {escape_sql(int(user_id))}")
+        execute(cur, 'auth_password_hash_by_id', (int(user_id),))
         row = cur.fetchone()
         if not row:
             return error_response('User not found', 404)
         if row[0] and not verify_password(old_password, row[0]):
             return error_response('Неверный текущий пароль', 401)
         ph = hash_password(new_password)
-        cur.execute(f"UPDATE users SET password_hash = {escape_sql(ph)} WHERE id = {escape_sql(int(user_id))}")
+        execute(cur, 'auth_set_password', (int(user_id), ph))
         return success_response({'message': 'Пароль изменён'})
 
     elif action == 'change_email':
@@ -520,17 +1209,18 @@ def handle_auth(cur, method: str, event: Dict[str, Any]) -> Dict[str, Any]:
         password = body.get('password', '')
         if not user_id or not new_email or not password:
             return error_response('user_id, new_email and password required', 400)
-        cur.execute(f"SELECT password_hash FROM users WHERE id = {escape_sql(int(user_id))}")
+        execute(cur, 'auth_password_hash_by_id', (int(user_id),))
         row = cur.fetchone()
         if not row:
             return error_response('User not found', 404)
         if row[0] and not verify_password(password, row[0]):
             return error_response('Неверный пароль', 401)
-        cur.execute(f"SELECT id FROM users WHERE email = {escape_sql(new_email)}")
+        execute(cur, 'user_id_by_email', (new_email,))
         if cur.fetchone():
             return error_response('Email уже используется', 409)
-        cur.execute(f"UPDATE users SET email = {escape_sql(new_email)} WHERE id = {escape_sql(int(user_id))} RETURNING id, email, name, role, created_at")
+        execute(cur, 'auth_set_email', (int(user_id), new_email))
         row = cur.fetchone()
+        bump_data_version(cur, 'users')
         return success_response({'id': row[0], 'email': row[1], 'name': row[2], 'role': row[3], 'created_at': row[4].isoformat() if row[4] else None})
 
     return error_response('Unknown action', 400)
@@ -541,19 +1231,25 @@ def format_object_with_broker(row) -> Dict[str, Any]:
         'id': row[0], 'brokerId': row[1], 'title': row[2], 'city': row[3],
         'address': row[4], 'propertyType': row[5], 'area': row[6], 'price': row[7],
         'yieldPercent': row[8], 'description': row[9], 'images': row[10],
-        'status': row[11], 'createdAt': row[12].isoformat() if row[12] else None,
-        'broker': {'id': row[13], 'name': row[14], 'email': row[15]} if row[13] else None
+        'status': row[11], 'createdAt': row[12],
+        'broker': {'id': row[13], 'name': row[14], 'email': row[15]} if row[13] else None,
+        'latitude': row[16], 'longitude': row[17],
+        'monthlyIncome': row[18], 'roiPercent': row[19], 'paybackMonths': row[20]
     }
 
 
-def success_response(data: Any, status: int = 200) -> Dict[str, Any]:
+def success_response(data: Any, status: int = 200, headers: Optional[Dict[str, str]] = None) -> Dict[str, Any]:
+    response_headers = {
+        'Content-Type': 'application/json',
+        'Access-Control-Allow-Origin': '*'
+    }
+    if headers:
+        response_headers.update(headers)
+        response_headers['Access-Control-Expose-Headers'] = ', '.join(headers)
     return {
         'statusCode': status,
-        'headers': {
-            'Content-Type': 'application/json',
-            'Access-Control-Allow-Origin': '*'
-        },
-        'body': json.dumps(data, default=str),
+        'headers': response_headers,
+        'body': dumps(data),
         'isBase64Encoded': False
     }
 
@@ -565,6 +1261,6 @@ def error_response(message: str, status: int = 400) -> Dict[str, Any]:
             'Content-Type': 'application/json',
             'Access-Control-Allow-Origin': '*'
         },
-        'body': json.dumps({'error': message}),
+        'body': dumps({'error': message}),
         'isBase64Encoded': False
     }
\ No newline at end of file
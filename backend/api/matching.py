@@ -0,0 +1,131 @@
+'''
+Investor x object matching, scored for all pairs at once with NumPy.
+Weights follow matchInvestorToProperty in src/utils/investmentStrategies.ts:
+strategy 30, property type 25, location 20, budget efficiency 10. Objects
+carry no risk level, so its 15 points go to yield relative to the best
+available object. Objects above an investor's budget are never matched; a
+budget of 0 or NULL (the CRM default) counts as unknown, so those investors
+are matched against every object and get no budget points.
+'''
+from typing import Dict, Any, List, Sequence, Set
+
+import numpy as np
+
+STRATEGY_WEIGHT = 30.0
+PROPERTY_TYPE_WEIGHT = 25.0
+LOCATION_WEIGHT = 20.0
+BUDGET_WEIGHT = 10.0
+YIELD_WEIGHT = 15.0
+
+# Sheet strategies are free Russian text; investor profiles use the frontend InvestmentStrategy codes
+STRATEGY_KEYWORDS = {
+    'rental': ('аренд', 'rental'),
+    'resale': ('перепрод', 'продаж', 'resale', 'флип'),
+    'development': ('строит', 'стройк', 'девел', 'development'),
+}
+
+
+def object_strategies(text: str) -> Set[str]:
+    normalized = (text or '').lower()
+    found = {code for code, keywords in STRATEGY_KEYWORDS.items() if any(k in normalized for k in keywords)}
+    if 'rental_and_resale' in normalized or {'rental', 'resale'} <= found:
+        found |= {'rental', 'resale', 'rental_and_resale'}
+    return found
+
+
+def investor_strategies(codes: Sequence[str]) -> Set[str]:
+    found = {code.lower() for code in codes or ()}
+    if 'rental_and_resale' in found:
+        found |= {'rental', 'resale'}
+    return found
+
+
+def multi_hot(sets: List[Set[str]], vocabulary: List[str]) -> np.ndarray:
+    index = {value: i for i, value in enumerate(vocabulary)}
+    matrix = np.zeros((len(sets), len(vocabulary)), dtype=np.float32)
+    for row, values in enumerate(sets):
+        for value in values:
+            if value in index:
+                matrix[row, index[value]] = 1.0
+    return matrix
+
+
+def score_matches(investors: List[tuple], objects: List[tuple], top_k: int, min_score: float) -> List[Dict[str, Any]]:
+    '''
+    investors: (id, budget, strategies, preferred_property_types, preferred_locations)
+    objects: (id, entry_amount, yield_percent, property_type, city, strategy)
+    Returns the top_k objects scoring at least min_score for every investor, best first.
+    '''
+    if not investors:
+        return []
+    if not objects:
+        return [{'investorId': str(inv[0]), 'matches': []} for inv in investors]
+
+    budget = np.array([float(inv[1] or 0) for inv in investors], dtype=np.float64)
+    entry = np.array([float(obj[1] or 0) for obj in objects], dtype=np.float64)
+    yields = np.array([float(obj[2] or 0) for obj in objects], dtype=np.float32)
+
+    inv_strategies = [investor_strategies(inv[2]) for inv in investors]
+    inv_types = [{t.lower() for t in inv[3] or ()} for inv in investors]
+    inv_locations = [{loc.lower() for loc in inv[4] or () if loc} for inv in investors]
+    obj_strategies = [object_strategies(obj[5]) for obj in objects]
+    obj_types = [{(obj[3] or '').lower()} for obj in objects]
+    obj_cities = [(obj[4] or '').lower() for obj in objects]
+
+    strategy_vocab = sorted(set().union(*inv_strategies))
+    type_vocab = sorted(set().union(*inv_types))
+    location_vocab = sorted(set().union(*inv_locations))
+
+    strategy_hit = multi_hot(inv_strategies, strategy_vocab) @ multi_hot(obj_strategies, strategy_vocab).T > 0
+    type_hit = multi_hot(inv_types, type_vocab) @ multi_hot(obj_types, type_vocab).T > 0
+    city_contains = np.array([[loc in city for loc in location_vocab] for city in obj_cities],
+                             dtype=np.float32).reshape(len(objects), len(location_vocab))
+    location_hit = multi_hot(inv_locations, location_vocab) @ city_contains.T > 0
+
+    budget_known = (budget > 0)[:, None]
+    affordable = (entry[None, :] <= budget[:, None]) | ~budget_known
+    with np.errstate(divide='ignore', invalid='ignore'):
+        efficiency = budget[:, None] / entry[None, :]
+    budget_hit = (efficiency >= 1) & (efficiency <= 2) & budget_known
+    best_yield = yields.max()
+    yield_score = YIELD_WEIGHT * yields / best_yield if best_yield > 0 else np.zeros_like(yields)
+
+    scores = (STRATEGY_WEIGHT * strategy_hit + PROPERTY_TYPE_WEIGHT * type_hit
+              + LOCATION_WEIGHT * location_hit + BUDGET_WEIGHT * budget_hit
+              + yield_score[None, :]).astype(np.float32)
+    scores[~affordable | (scores < min_score)] = -np.inf
+
+    k = min(top_k, len(objects))
+    top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    top_scores = np.take_along_axis(scores, top, axis=1)
+    order = np.argsort(-top_scores, axis=1, kind='stable')
+    top = np.take_along_axis(top, order, axis=1)
+
+    results = []
+    for i, inv in enumerate(investors):
+        matches = []
+        for j in top[i]:
+            if not np.isfinite(scores[i, j]):
+                break
+            matches.append({
+                'objectId': objects[j][0],
+                'matchScore': round(float(scores[i, j]), 1),
+                'reasons': match_reasons(bool(strategy_hit[i, j]), bool(type_hit[i, j]),
+                                         bool(location_hit[i, j]), bool(budget_hit[i, j])),
+                'yieldPercent': float(yields[j])
+            })
+        results.append({'investorId': str(inv[0]), 'matches': matches})
+    return results
+
+
+def match_reasons(strategy: bool, property_type: bool, location: bool, budget: bool) -> List[str]:
+    reasons = []
+    if strategy:
+        reasons.append('Подходящая стратегия инвестирования')
+    if property_type:
+        reasons.append('Предпочитаемый тип недвижимости')
+    if location:
+        reasons.append('Желаемая локация')
+    if budget:
+        reasons.append('Оптимальное использование бюджета')
+    return reasons
@@ -0,0 +1,50 @@
+'''
+Benchmark: password hash latency per work factor, used to pick AUTH_SCRYPT_N
+(or AUTH_PBKDF2_ITERATIONS without scrypt) so a login stays within its latency
+budget. Prints p50/p99 per setting and the strongest one whose p99 fits.
+Run on the function's instance size with: python password_benchmark.py [budget_ms] [samples]
+'''
+import sys
+import time
+from typing import List, Tuple
+
+import passwords
+
+SCRYPT_CANDIDATES = [2 ** 12, 2 ** 13, 2 ** 14, 2 ** 15, 2 ** 16]
+PBKDF2_CANDIDATES = [100_000, 200_000, 300_000, 600_000]
+
+
+def percentiles(timings: List[float]) -> Tuple[float, float]:
+    timings = sorted(timings)
+    return timings[len(timings) // 2] * 1000, timings[min(len(timings) - 1, int(len(timings) * 0.99))] * 1000
+
+
+def measure(samples: int, **factor) -> Tuple[float, float]:
+    stored = passwords.hash_password('benchmark-password', **factor)
+    timings = []
+    for _ in range(samples):
+        started = time.perf_counter()
+        passwords.verify_password('benchmark-password', stored)
+        timings.append(time.perf_counter() - started)
+    return percentiles(timings)
+
+
+def main() -> None:
+    budget_ms = float(sys.argv[1]) if len(sys.argv) > 1 else 100.0
+    samples = int(sys.argv[2]) if len(sys.argv) > 2 else 50
+    scrypt = passwords.scrypt_available()
+    name, candidates = ('n', SCRYPT_CANDIDATES) if scrypt else ('iterations', PBKDF2_CANDIDATES)
+    print(f"{'scrypt' if scrypt else 'pbkdf2_sha256'}, p99 budget {budget_ms:g} ms, {samples} samples")
+
+    best = None
+    for value in candidates:
+        p50, p99 = measure(samples, **{name: value})
+        print(f'{name}={value:<8} p50 {p50:>7.1f} ms  p99 {p99:>7.1f} ms')
+        if p99 <= budget_ms:
+            best = value
+    env = 'AUTH_SCRYPT_N' if scrypt else 'AUTH_PBKDF2_ITERATIONS'
+    print(f'{env}={best}' if best else f'no {name} fits {budget_ms:g} ms')
+
+
+if __name__ == '__main__':
+    main()
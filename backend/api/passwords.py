@@ -0,0 +1,76 @@
+'''
+Password hashing for resource=auth. New hashes are scrypt from the stdlib,
+stored as scrypt$n$r$p$salt$key (base64); Python builds without
+hashlib.scrypt fall back to pbkdf2_sha256$iterations$salt$key. The legacy
+unsalted sha256 hex digests still verify and report needs_rehash, so a
+successful login upgrades them in place. Work factors were picked with
+password_benchmark.py for a ~100 ms p99 per hash and can be retuned via env.
+'''
+import os
+import hmac
+import base64
+import hashlib
+
+SCRYPT_N = int(os.environ.get('AUTH_SCRYPT_N', str(2 ** 14)))
+SCRYPT_R = int(os.environ.get('AUTH_SCRYPT_R', '8'))
+SCRYPT_P = int(os.environ.get('AUTH_SCRYPT_P', '1'))
+PBKDF2_ITERATIONS = int(os.environ.get('AUTH_PBKDF2_ITERATIONS', '200000'))
+SALT_BYTES = 16
+KEY_BYTES = 32
+
+
+def scrypt_available() -> bool:
+    return hasattr(hashlib, 'scrypt')
+
+
+def _b64(raw: bytes) -> str:
+    return base64.b64encode(raw).decode('ascii').rstrip('=')
+
+
+def _unb64(text: str) -> bytes:
+    return base64.b64decode(text + '=' * (-len(text) % 4))
+
+
+def _scrypt(password: str, salt: bytes, n: int, r: int, p: int) -> bytes:
+    # scrypt needs 128 * n * r bytes; OpenSSL's default 32 MiB cap would reject larger factors
+    return hashlib.scrypt(password.encode(), salt=salt, n=n, r=r, p=p,
+                          maxmem=256 * n * r + 1024 * 1024, dklen=KEY_BYTES)
+
+
+def _pbkdf2(password: str, salt: bytes, iterations: int) -> bytes:
+    return hashlib.pbkdf2_hmac('sha256', password.encode(), salt, iterations, dklen=KEY_BYTES)
+
+
+def hash_password(password: str, n: int = SCRYPT_N, iterations: int = PBKDF2_ITERATIONS) -> str:
+    salt = os.urandom(SALT_BYTES)
+    if scrypt_available():
+        key = _scrypt(password, salt, n, SCRYPT_R, SCRYPT_P)
+        return f'scrypt${n}${SCRYPT_R}${SCRYPT_P}${_b64(salt)}${_b64(key)}'
+    return f'pbkdf2_sha256${iterations}${_b64(salt)}${_b64(_pbkdf2(password, salt, iterations))}'
+
+
+def verify_password(password: str, stored: str) -> bool:
+    try:
+        if stored.startswith('scrypt$'):
+            _, n, r, p, salt, key = stored.split('$')
+            return hmac.compare_digest(_scrypt(password, _unb64(salt), int(n), int(r), int(p)), _unb64(key))
+        if stored.startswith('pbkdf2_sha256$'):
+            _, iterations, salt, key = stored.split('$')
+            return hmac.compare_digest(_pbkdf2(password, _unb64(salt), int(iterations)), _unb64(key))
+    except (ValueError, TypeError):
+        return False
+    # Legacy: unsalted sha256 hex (V0019 and accounts registered before scrypt)
+    return hmac.compare_digest(hashlib.sha256(password.encode()).hexdigest(), stored)
+
+
+def needs_rehash(stored: str) -> bool:
+    '''True for legacy digests and for hashes weaker than the current work factor'''
+    parts = stored.split('$')
+    try:
+        if scrypt_available():
+            return parts[0] != 'scrypt' or int(parts[1]) < SCRYPT_N or int(parts[2]) < SCRYPT_R or int(parts[3]) < SCRYPT_P
+        if parts[0] == 'scrypt':
+            return False
+        return parts[0] != 'pbkdf2_sha256' or int(parts[1]) < PBKDF2_ITERATIONS
+    except (IndexError, ValueError):
+        return True
@@ -0,0 +1,69 @@
+'''
+Login throttling with in-process token buckets, one per client IP and one per
+email, checked before resource=auth borrows a database connection. Buckets
+live in the warm container, so the limit is per instance; that is enough to
+make password guessing slow without a round trip to Postgres per attempt.
+'''
+import os
+import time
+import threading
+from collections import OrderedDict
+from typing import Dict, Any, Optional, Tuple
+
+AUTH_IP_BURST = int(os.environ.get('AUTH_RATE_IP_BURST', '20'))
+AUTH_IP_PER_MINUTE = float(os.environ.get('AUTH_RATE_IP_PER_MINUTE', '30'))
+AUTH_EMAIL_BURST = int(os.environ.get('AUTH_RATE_EMAIL_BURST', '5'))
+AUTH_EMAIL_PER_MINUTE = float(os.environ.get('AUTH_RATE_EMAIL_PER_MINUTE', '5'))
+RATE_LIMIT_MAX_KEYS = int(os.environ.get('AUTH_RATE_MAX_KEYS', '10000'))
+
+
+class TokenBucketLimiter:
+    '''burst tokens per key, refilled at per_minute; least recently seen keys are evicted past max_keys'''
+
+    def __init__(self, burst: int, per_minute: float, max_keys: int = RATE_LIMIT_MAX_KEYS):
+        self.burst = max(1, burst)
+        self.rate = per_minute / 60
+        self.max_keys = max(1, max_keys)
+        self.rejected = 0
+        self._buckets: 'OrderedDict[str, Tuple[float, float]]' = OrderedDict()
+        self._lock = threading.Lock()
+
+    def acquire(self, key: str) -> float:
+        '''Takes a token and returns 0, or returns the seconds until one is available'''
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated_at = self._buckets.pop(key, (float(self.burst), now))
+            tokens = min(float(self.burst), tokens + (now - updated_at) * self.rate)
+            if tokens >= 1:
+                tokens -= 1
+                wait = 0.0
+            else:
+                self.rejected += 1
+                wait = (1 - tokens) / self.rate if self.rate > 0 else float('inf')
+            self._buckets[key] = (tokens, now)
+            while len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+            return wait
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {'keys': len(self._buckets), 'rejected': self.rejected}
+
+
+_ip_limiter = TokenBucketLimiter(AUTH_IP_BURST, AUTH_IP_PER_MINUTE)
+_email_limiter = TokenBucketLimiter(AUTH_EMAIL_BURST, AUTH_EMAIL_PER_MINUTE)
+
+
+def login_retry_after(ip: Optional[str], email: Optional[str]) -> float:
+    '''0 when the attempt may proceed, else seconds to wait; the IP bucket is charged first'''
+    if ip:
+        wait = _ip_limiter.acquire(ip)
+        if wait:
+            return wait
+    if email:
+        return _email_limiter.acquire(email)
+    return 0.0
+
+
+def rate_limit_stats() -> Dict[str, Any]:
+    return {'ip': _ip_limiter.stats(), 'email': _email_limiter.stats()}
@@ -0,0 +1,36 @@
+'''
+JSON encoding for API responses: orjson when it is installed, the stdlib
+otherwise. Both emit compact UTF-8 JSON, datetimes/dates as ISO 8601 and
+Decimal (NUMERIC columns) as numbers.
+'''
+import json
+import datetime
+from decimal import Decimal
+from typing import Any
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def _default(value: Any) -> Any:
+    if isinstance(value, Decimal):
+        return float(value)
+    if isinstance(value, (datetime.datetime, datetime.date, datetime.time)):
+        return value.isoformat()
+    raise TypeError(f'Object of type {type(value).__name__} is not JSON serializable')
+
+
+def dumps_bytes(data: Any) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(data, default=_default)
+    return json.dumps(data, default=_default, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+
+def dumps(data: Any) -> str:
+    return dumps_bytes(data).decode('utf-8')
+
+
+def backend_name() -> str:
+    return 'orjson' if orjson is not None else 'json'
@@ -0,0 +1,102 @@
+'''
+Benchmark: legacy split/char-walk CSV parser vs the streaming csv-module parser
+on a synthetic 50k-row broker sheet. Run with: python benchmark.py [rows]
+'''
+import io
+import sys
+import time
+import random
+import tracemalloc
+from typing import List
+
+from index import map_row_to_object, read_sheet_objects
+
+
+def legacy_parse_csv(csv_text: str) -> List[List[str]]:
+    lines = [line for line in csv_text.split('\n') if line.strip()]
+    if not lines:
+        return []
+
+    rows = []
+    for line in lines:
+        rows.append(legacy_parse_csv_line(line))
+
+    return rows
+
+
+def legacy_parse_csv_line(line: str) -> List[str]:
+    result = []
+    current = ''
+    in_quotes = False
+
+    i = 0
+    while i < len(line):
+        char = line[i]
+
+        if char == '"':
+            if in_quotes and i + 1 < len(line) and line[i + 1] == '"':
+                current += '"'
+                i += 1
+            else:
+                in_quotes = not in_quotes
+        elif char == ',' and not in_quotes:
+            result.append(current)
+            current = ''
+        else:
+            current += char
+
+        i += 1
+
+    result.append(current)
+    return result
+
+
+def synthetic_sheet(rows: int) -> bytes:
+    rnd = random.Random(42)
+    lines = ['"Объект / фокус внимания",,,,,,,,,,,,,,', ',,,,,,,,,,,,,,', 'Название,,,Мин. вход,Цена,Платёж,Стратегия,Цикл,Доходность,,,,Ссылка,,Решение']
+    for i in range(rows):
+        lines.append(','.join([
+            f'"Квартира №{i}, ЖК ""Северный"""',
+            '', '',
+            f'"{rnd.randint(1, 50) * 100_000:,}"'.replace(',', ' '),
+            f'{rnd.randint(3, 90) * 1_000_000}',
+            f'{rnd.randint(10, 300) * 1000}',
+            'Аренда',
+            f'{rnd.randint(6, 36)} мес.',
+            f'{rnd.randint(5, 30)},{rnd.randint(0, 9)}%',
+            '', '', '',
+            f'https://example.com/p/{i}',
+            '',
+            'Одобрено'
+        ]))
+    return '\n'.join(lines).encode('utf-8')
+
+
+def run(label: str, fn) -> None:
+    tracemalloc.start()
+    started = time.perf_counter()
+    count = fn()
+    elapsed = time.perf_counter() - started
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f'{label:<10} {elapsed * 1000:>9.1f} ms  peak {peak / 1024 / 1024:>7.1f} MB  objects {count}')
+
+
+def main() -> None:
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 50_000
+    payload = synthetic_sheet(rows)
+    print(f'{rows} rows, {len(payload) / 1024 / 1024:.1f} MB of CSV')
+
+    def legacy() -> int:
+        parsed = legacy_parse_csv(payload.decode('utf-8'))
+        return len([obj for obj in (map_row_to_object(row, 1) for row in parsed[3:]) if obj])
+
+    def streaming() -> int:
+        return len(read_sheet_objects(io.BytesIO(payload), 1)['objects'])
+
+    run('legacy', legacy)
+    run('streaming', streaming)
+
+
+if __name__ == '__main__':
+    main()
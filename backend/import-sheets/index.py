@@ -1,21 +1,60 @@
 import json
 import os
+import io
+import csv
+import time
+import socket
+import hashlib
 import psycopg2
+import psycopg2.extras
+import urllib.error
 import urllib.request
 import urllib.parse
-from typing import Dict, Any, List
-
-def escape_sql(value):
-    '''Escape values for Simple Query Protocol'''
-    if value is None:
-        return 'NULL'
-    if isinstance(value, bool):
-        return 'true' if value else 'false'
-    if isinstance(value, (int, float)):
-        return str(value)
-    if isinstance(value, str):
-        return "'" + value.replace("'", "''").replace('\\', '\\\\') + "'"
-    return "'" + str(value).replace("'", "''").replace('\\', '\\\\') + "'"
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, List, Tuple, Iterable, Iterator
+from db import get_connection, execute, bump_data_version
+
+SHEET_ID = os.environ.get('GOOGLE_SHEET_ID', '1jnOO6dUJ6z903U1IVd8eZRJR7l-gn_62oJ9y-sQUnaU')
+SHEETS_BASE_URL = os.environ.get('SHEETS_BASE_URL', 'https://docs.google.com').rstrip('/')
+FETCH_CONCURRENCY = int(os.environ.get('IMPORT_FETCH_CONCURRENCY', '4'))
+FETCH_TIMEOUT = float(os.environ.get('IMPORT_FETCH_TIMEOUT', '15'))
+FETCH_RETRIES = int(os.environ.get('IMPORT_FETCH_RETRIES', '2'))
+FETCH_BACKOFF = float(os.environ.get('IMPORT_FETCH_BACKOFF', '0.5'))
+READ_CHUNK_SIZE = 64 * 1024
+SHEET_HEADER_ROWS = 3
+
+IMPORT_FIELDS = (
+    'title', 'price', 'yield_percent', 'min_investment', 'monthly_payment', 'strategy',
+    'deal_cycle', 'presentation_link', 'investment_decision', 'images', 'status'
+)
+
+IMPORT_INSERT_SQL = """
+    INSERT INTO investment_objects
+    (broker_id, title, price, yield_percent, min_investment,
+     monthly_payment, strategy, deal_cycle, presentation_link,
+     investment_decision, images, status, source_key, row_hash,
+     city, address, property_type, area, description)
+    VALUES %s
+"""
+
+IMPORT_ROW_TEMPLATE = (
+    "(%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s::text[], %s, %s, %s, "
+    "'Москва', '', 'new_flat', 0, 'Описание будет добавлено брокером')"
+)
+
+IMPORT_UPDATE_SQL = """
+    UPDATE investment_objects o SET
+        title = v.title, price = v.price, yield_percent = v.yield_percent,
+        min_investment = v.min_investment, monthly_payment = v.monthly_payment,
+        strategy = v.strategy, deal_cycle = v.deal_cycle, presentation_link = v.presentation_link,
+        investment_decision = v.investment_decision, images = v.images,
+        source_key = v.source_key, row_hash = v.row_hash, updated_at = CURRENT_TIMESTAMP
+    FROM (VALUES %s) AS v(id, title, price, yield_percent, min_investment, monthly_payment, strategy,
+                          deal_cycle, presentation_link, investment_decision, images, source_key, row_hash)
+    WHERE o.id = v.id
+"""
+
+IMPORT_UPDATE_TEMPLATE = "(%s, %s, %s::numeric, %s::numeric, %s::numeric, %s::numeric, %s, %s, %s, %s, %s::text[], %s, %s)"
 
 def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     '''
@@ -24,7 +63,7 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     Returns: HTTP response with import results
     '''
     method: str = event.get('httpMethod', 'GET')
-    
+
     if method == 'OPTIONS':
         return {
             'statusCode': 200,
@@ -37,163 +76,295 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             'body': '',
             'isBase64Encoded': False
         }
-    
+
     if method != 'POST':
         return error_response('Method not allowed', 405)
-    
-    conn = None
+
     try:
-        dsn = os.environ.get('DATABASE_URL')
-        conn = psycopg2.connect(dsn)
-        conn.autocommit = True
-        cur = conn.cursor()
-        
-        user_id = event.get('headers', {}).get('x-user-id')
-        if not user_id:
-            return error_response('Authentication required', 401)
-        
-        cur.execute(f"SELECT role FROM users WHERE id = {int(user_id)}")
-        user_row = cur.fetchone()
-        
-        if not user_row or user_row[0] not in ['admin', 'manager']:
-            return error_response('Admin or Manager access required', 403)
-        
-        cur.execute("SELECT id, name, email FROM users WHERE role = 'broker' ORDER BY id")
-        brokers = cur.fetchall()
-        
-        if not brokers:
-            return error_response('No brokers found', 404)
-        
-        SHEET_ID = '1jnOO6dUJ6z903U1IVd8eZRJR7l-gn_62oJ9y-sQUnaU'
-        
-        total_imported = 0
-        total_deleted = 0
-        broker_results = []
-        
-        for broker_id, broker_name, broker_email in brokers:
-            sheet_name = broker_name
-            csv_url = f'https://docs.google.com/spreadsheets/d/{SHEET_ID}/gviz/tq?tqx=out:csv&sheet={urllib.parse.quote(sheet_name)}'
-            
-            try:
-                with urllib.request.urlopen(csv_url) as response:
-                    csv_text = response.read().decode('utf-8')
-                
-                rows = parse_csv(csv_text)
-                
-                if not rows or len(rows) < 2:
+        with get_connection() as conn:
+            cur = conn.cursor()
+
+            user_id = event.get('headers', {}).get('x-user-id')
+            if not user_id:
+                return error_response('Authentication required', 401)
+
+            execute(cur, 'user_role_by_id', (int(user_id),))
+            user_row = cur.fetchone()
+
+            if not user_row or user_row[0] not in ['admin', 'manager']:
+                return error_response('Admin or Manager access required', 403)
+
+            body = json.loads(event.get('body') or '{}')
+            mode = body.get('mode', 'incremental')
+            if mode not in ('incremental', 'replace'):
+                return error_response('mode must be incremental or replace', 400)
+
+            execute(cur, 'brokers_all')
+            brokers = cur.fetchall()
+
+            if not brokers:
+                return error_response('No brokers found', 404)
+
+            execute(cur, 'sheet_hashes_all')
+            sheet_hashes = dict(cur.fetchall())
+
+            total_imported = 0
+            total_updated = 0
+            total_deleted = 0
+            broker_results = []
+            import_started = time.monotonic()
+            sheets = fetch_all_sheets(brokers)
+
+            for broker_id, broker_name, broker_email in brokers:
+                try:
+                    sheet = sheets[broker_id].result()
+                    content_hash = sheet['content_hash']
+                    fetch_ms = sheet['fetch_ms']
+
+                    if mode == 'incremental' and sheet_hashes.get(broker_id) == content_hash:
+                        broker_results.append({'broker': broker_name, 'status': 'unchanged', 'fetch_ms': fetch_ms})
+                        continue
+
+                    if sheet['row_count'] < 2:
+                        broker_results.append({
+                            'broker': broker_name,
+                            'status': 'skipped',
+                            'message': 'No data or sheet not found'
+                        })
+                        continue
+
+                    objects = sheet['objects']
+                    assign_import_identity(objects, broker_id)
+                    if mode == 'replace':
+                        result = load_broker_objects(conn, broker_id, objects, content_hash)
+                    else:
+                        result = sync_broker_objects(conn, broker_id, objects, content_hash)
+                    total_deleted += result['deleted']
+                    total_updated += result.get('updated', 0)
+                    total_imported += result['imported']
+                    broker_results.append({'broker': broker_name, 'status': 'success', 'fetch_ms': fetch_ms, **result})
+
+                except Exception as e:
                     broker_results.append({
                         'broker': broker_name,
-                        'status': 'skipped',
-                        'message': 'No data or sheet not found'
+                        'status': 'error',
+                        'message': str(e)
                     })
-                    continue
-                
-                cur.execute(f"DELETE FROM investment_objects WHERE broker_id = {broker_id}")
-                deleted_count = cur.rowcount
-                total_deleted += deleted_count
-                
-                imported_count = 0
-                for row in rows[3:]:
-                    obj = map_row_to_object(row, broker_id)
-                    if obj:
-                        try:
-                            images_json = escape_sql(json.dumps(obj['images']))
-                            
-                            query = f"""
-                                INSERT INTO investment_objects 
-                                (broker_id, title, price, yield_percent, min_investment, 
-                                 monthly_payment, strategy, deal_cycle, presentation_link, 
-                                 investment_decision, images, status, city, address, 
-                                 property_type, area, description)
-                                VALUES (
-                                    {obj['broker_id']}, 
-                                    {escape_sql(obj['title'])},
-                                    {obj['price']}, 
-                                    {obj['yield_percent']}, 
-                                    {obj['min_investment']},
-                                    {obj['monthly_payment']},
-                                    {escape_sql(obj['strategy'])},
-                                    {escape_sql(obj['deal_cycle'])},
-                                    {escape_sql(obj['presentation_link'])},
-                                    {escape_sql(obj['investment_decision'])},
-                                    {images_json}, 
-                                    {escape_sql(obj['status'])},
-                                    'Москва', '', 'flats', 0,
-                                    'Описание будет добавлено брокером'
-                                )
-                            """
-                            cur.execute(query)
-                            imported_count += 1
-                        except Exception as e:
-                            print(f"Error importing object for {broker_name}: {e}")
-                
-                total_imported += imported_count
-                broker_results.append({
-                    'broker': broker_name,
-                    'status': 'success',
-                    'deleted': deleted_count,
-                    'imported': imported_count
-                })
-                
-            except Exception as e:
-                broker_results.append({
-                    'broker': broker_name,
-                    'status': 'error',
-                    'message': str(e)
-                })
-        
-        return success_response({
-            'message': 'Import completed',
-            'total_deleted': total_deleted,
-            'total_imported': total_imported,
-            'brokers': broker_results
-        })
-    
+
+            return success_response({
+                'message': 'Import completed',
+                'mode': mode,
+                'total_deleted': total_deleted,
+                'total_updated': total_updated,
+                'total_imported': total_imported,
+                'duration_ms': round((time.monotonic() - import_started) * 1000, 1),
+                'brokers': broker_results
+            })
+
     except Exception as e:
         return error_response(f'Import failed: {str(e)}', 500)
-    
+
+
+def sheet_csv_url(sheet_name: str) -> str:
+    return f'{SHEETS_BASE_URL}/spreadsheets/d/{SHEET_ID}/gviz/tq?tqx=out:csv&sheet={urllib.parse.quote(sheet_name)}'
+
+
+def fetch_sheet(broker_id: int, sheet_name: str) -> Dict[str, Any]:
+    '''Stream one sheet as CSV into objects, retrying timeouts, 429 and 5xx with exponential backoff'''
+    started = time.monotonic()
+    for attempt in range(FETCH_RETRIES + 1):
+        try:
+            with urllib.request.urlopen(sheet_csv_url(sheet_name), timeout=FETCH_TIMEOUT) as response:
+                sheet = read_sheet_objects(response, broker_id)
+            sheet['fetch_ms'] = round((time.monotonic() - started) * 1000, 1)
+            return sheet
+        except urllib.error.HTTPError as e:
+            if (e.code < 500 and e.code != 429) or attempt == FETCH_RETRIES:
+                raise
+        except (urllib.error.URLError, socket.timeout, TimeoutError):
+            if attempt == FETCH_RETRIES:
+                raise
+        time.sleep(FETCH_BACKOFF * 2 ** attempt)
+
+
+def fetch_all_sheets(brokers: List[tuple]) -> Dict[int, Any]:
+    '''
+    Start every broker's sheet download at once on a bounded thread pool.
+    Returns futures keyed by broker id; DB writes stay serialized in the caller.
+    '''
+    executor = ThreadPoolExecutor(max_workers=max(1, min(FETCH_CONCURRENCY, len(brokers))))
+    try:
+        return {broker_id: executor.submit(fetch_sheet, broker_id, name) for broker_id, name, _ in brokers}
     finally:
-        if conn:
-            conn.close()
-
-
-def parse_csv(csv_text: str) -> List[List[str]]:
-    lines = [line for line in csv_text.split('\n') if line.strip()]
-    if not lines:
-        return []
-    
-    rows = []
-    for line in lines:
-        rows.append(parse_csv_line(line))
-    
-    return rows
-
-
-def parse_csv_line(line: str) -> List[str]:
-    result = []
-    current = ''
-    in_quotes = False
-    
-    i = 0
-    while i < len(line):
-        char = line[i]
-        
-        if char == '"':
-            if in_quotes and i + 1 < len(line) and line[i + 1] == '"':
-                current += '"'
-                i += 1
-            else:
-                in_quotes = not in_quotes
-        elif char == ',' and not in_quotes:
-            result.append(current)
-            current = ''
-        else:
-            current += char
-        
-        i += 1
-    
-    result.append(current)
-    return result
+        executor.shutdown(wait=False)
+
+
+def source_key(broker_id: int, title: str, occurrence: int = 0) -> str:
+    '''Stable identity of a sheet row: broker plus title, with an occurrence number for repeated titles'''
+    raw = f'{broker_id}|{title.strip().lower()}' + (f'|{occurrence}' if occurrence else '')
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+
+def assign_import_identity(objects: List[Dict[str, Any]], broker_id: int) -> None:
+    seen: Dict[str, int] = {}
+    for obj in objects:
+        title = obj['title'].strip().lower()
+        occurrence = seen.get(title, 0)
+        seen[title] = occurrence + 1
+        obj['source_key'] = source_key(broker_id, obj['title'], occurrence)
+        obj['row_hash'] = hashlib.sha256(
+            json.dumps([obj[field] for field in IMPORT_FIELDS], ensure_ascii=False).encode('utf-8')
+        ).hexdigest()
+
+
+def import_row_values(obj: Dict[str, Any]) -> tuple:
+    return (
+        obj['broker_id'],
+        obj['title'],
+        obj['price'],
+        obj['yield_percent'],
+        obj['min_investment'],
+        obj['monthly_payment'],
+        obj['strategy'],
+        obj['deal_cycle'],
+        obj['presentation_link'],
+        obj['investment_decision'],
+        obj['images'],
+        obj['status'],
+        obj['source_key'],
+        obj['row_hash']
+    )
+
+
+def sync_broker_objects(conn, broker_id: int, objects: List[Dict[str, Any]], content_hash: str) -> Dict[str, Any]:
+    '''
+    Apply only the difference between the sheet and the broker's current rows, in one transaction.
+    Unchanged rows keep their ids (and favorites); rows created before source_key existed are
+    matched by title the first time and adopted.
+    '''
+    started = time.monotonic()
+    conn.autocommit = False
+    try:
+        with conn.cursor() as cur:
+            execute(cur, 'objects_sync_state_by_broker', (broker_id,))
+            current: Dict[str, Tuple[int, str]] = {}
+            seen: Dict[str, int] = {}
+            for object_id, title, key, row_hash in cur.fetchall():
+                if not key:
+                    normalized = (title or '').strip().lower()
+                    occurrence = seen.get(normalized, 0)
+                    seen[normalized] = occurrence + 1
+                    key = source_key(broker_id, title or '', occurrence)
+                current.setdefault(key, (object_id, row_hash))
+
+            to_insert = [obj for obj in objects if obj['source_key'] not in current]
+            to_update = [
+                (current[obj['source_key']][0],) + import_row_values(obj)[1:11] + (obj['source_key'], obj['row_hash'])
+                for obj in objects
+                if obj['source_key'] in current and current[obj['source_key']][1] != obj['row_hash']
+            ]
+            wanted = {obj['source_key'] for obj in objects}
+            to_delete = [object_id for key, (object_id, _) in current.items() if key not in wanted]
+
+            if to_delete:
+                execute(cur, 'favorites_delete_by_objects', (to_delete,))
+                execute(cur, 'objects_delete_by_ids', (to_delete,))
+            if to_update:
+                psycopg2.extras.execute_values(cur, IMPORT_UPDATE_SQL, to_update,
+                                               template=IMPORT_UPDATE_TEMPLATE, page_size=len(to_update))
+            if to_insert:
+                psycopg2.extras.execute_values(cur, IMPORT_INSERT_SQL, [import_row_values(obj) for obj in to_insert],
+                                               template=IMPORT_ROW_TEMPLATE, page_size=len(to_insert))
+            if to_delete or to_update or to_insert:
+                bump_data_version(cur, 'objects')
+            execute(cur, 'sheet_hash_upsert', (broker_id, content_hash))
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.autocommit = True
+
+    return {
+        'deleted': len(to_delete),
+        'updated': len(to_update),
+        'imported': len(to_insert),
+        'unchanged': len(objects) - len(to_insert) - len(to_update),
+        'duration_ms': round((time.monotonic() - started) * 1000, 1)
+    }
+
+
+def load_broker_objects(conn, broker_id: int, objects: List[Dict[str, Any]], content_hash: str) -> Dict[str, Any]:
+    '''
+    Replace a broker's objects in one transaction: DELETE plus a single multi-row INSERT.
+    Readers see either the old set or the new one, never a half-loaded catalogue.
+    '''
+    started = time.monotonic()
+    conn.autocommit = False
+    try:
+        with conn.cursor() as cur:
+            execute(cur, 'objects_delete_by_broker', (broker_id,))
+            deleted_count = cur.rowcount
+            if objects:
+                psycopg2.extras.execute_values(cur, IMPORT_INSERT_SQL, [import_row_values(obj) for obj in objects],
+                                               template=IMPORT_ROW_TEMPLATE, page_size=len(objects))
+            bump_data_version(cur, 'objects')
+            execute(cur, 'sheet_hash_upsert', (broker_id, content_hash))
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.autocommit = True
+
+    return {
+        'deleted': deleted_count,
+        'imported': len(objects),
+        'duration_ms': round((time.monotonic() - started) * 1000, 1)
+    }
+
+
+class HashingReader(io.RawIOBase):
+    '''Raw byte stream that feeds everything it reads into a sha256 digest'''
+
+    def __init__(self, raw):
+        self.raw = raw
+        self.digest = hashlib.sha256()
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, buffer) -> int:
+        chunk = self.raw.read(len(buffer))
+        size = len(chunk)
+        buffer[:size] = chunk
+        self.digest.update(chunk)
+        return size
+
+
+def iter_csv_rows(stream: Iterable[str]) -> Iterator[List[str]]:
+    '''Lazily parse CSV rows, handling quoted commas and newlines; blank lines are skipped'''
+    for row in csv.reader(stream):
+        if len(row) > 1 or (row and row[0].strip()):
+            yield row
+
+
+def read_sheet_objects(raw, broker_id: int) -> Dict[str, Any]:
+    '''
+    Stream a sheet CSV from a binary file-like object straight into map_row_to_object.
+    Neither the full text nor the full row list is kept; only the mapped objects are.
+    '''
+    reader = HashingReader(raw)
+    text = io.TextIOWrapper(io.BufferedReader(reader, buffer_size=READ_CHUNK_SIZE), encoding='utf-8', newline='')
+    objects = []
+    row_count = 0
+    for row in iter_csv_rows(text):
+        row_count += 1
+        if row_count > SHEET_HEADER_ROWS:
+            obj = map_row_to_object(row, broker_id)
+            if obj:
+                objects.append(obj)
+    return {'objects': objects, 'row_count': row_count, 'content_hash': reader.digest.hexdigest()}
 
 
 def map_row_to_object(row: List[str], broker_id: int) -> Dict[str, Any]:
@@ -206,14 +377,14 @@ def map_row_to_object(row: List[str], broker_id: int) -> Dict[str, Any]:
             return float(cleaned)
         except:
             return 0.0
-    
+
     def get_col(row: List[str], index: int) -> str:
         return row[index].strip() if index < len(row) else ''
-    
+
     title = get_col(row, 0)
     if not title or title in ['Объект / фокус внимания', '']:
         return None
-    
+
     return {
         'broker_id': broker_id,
         'title': title,
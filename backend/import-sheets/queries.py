@@ -0,0 +1,198 @@
+'''
+Named SQL shared by the backend functions. Each entry is sent once per
+connection as a server-side PREPARE and then run with EXECUTE, so
+Postgres parses and plans it only once per warm connection.
+'''
+
+USER_COLUMNS = "id, email, name, role, created_at"
+
+OBJECT_WITH_BROKER_COLUMNS = """
+    o.id, o.broker_id, o.title, o.city, o.address, o.property_type, o.area, o.price,
+    o.yield_percent, o.description, o.images, o.status, o.created_at,
+    u.id, u.name, u.email, o.latitude, o.longitude,
+    o.monthly_income, o.roi_percent, o.payback_months
+"""
+
+# One timeline entry in the shape the frontend keeps ({date, action, details})
+TIMELINE_EVENT_JSON = "jsonb_build_object('date', e.occurred_at, 'action', e.action, 'details', e.details)"
+TIMELINE_EVENTS = (
+    f"COALESCE((SELECT jsonb_agg({TIMELINE_EVENT_JSON} ORDER BY e.id) FROM broker_investor_events e "
+    "WHERE e.investor_id = broker_investors.id), '[]'::jsonb)"
+)
+
+# {timeline} lets listings swap the full history for an empty or truncated one
+INVESTOR_SELECT = (
+    "id, broker_id, first_name, last_name, email, phone, budget, source, stage, notes, "
+    "{timeline}, total_invested, active_investments, total_return, created_at, updated_at, "
+    "strategies, preferred_property_types, preferred_locations"
+)
+INVESTOR_COLUMNS = INVESTOR_SELECT.format(timeline=TIMELINE_EVENTS)
+
+QUERIES = {
+    # users
+    'user_by_id': f"SELECT {USER_COLUMNS} FROM users WHERE id = $1",
+    'user_by_email': f"SELECT {USER_COLUMNS} FROM users WHERE email = $1",
+    'user_id_by_email': "SELECT id FROM users WHERE email = $1",
+    'user_role_by_id': "SELECT role FROM users WHERE id = $1",
+    'users_recent': f"SELECT {USER_COLUMNS} FROM users ORDER BY created_at DESC LIMIT 100",
+    'users_all': "SELECT id, email, name, role FROM users ORDER BY id",
+    'brokers_all': "SELECT id, name, email FROM users WHERE role = 'broker' ORDER BY id",
+    'user_insert': f"INSERT INTO users (email, name, role) VALUES ($1, $2, $3) RETURNING {USER_COLUMNS}",
+    'user_upsert': """
+        INSERT INTO users (email, name, role) VALUES ($1, $2, $3)
+        ON CONFLICT (email) DO UPDATE SET name = EXCLUDED.name, role = EXCLUDED.role
+        RETURNING id, email, name, role
+    """,
+    'user_replace': "UPDATE users SET email = $2, name = $3, role = $4 WHERE id = $1 RETURNING id, email, name, role",
+    'user_delete': "DELETE FROM users WHERE id = $1",
+
+    # auth
+    'auth_user_by_email': f"SELECT {USER_COLUMNS}, password_hash FROM users WHERE email = $1",
+    'auth_register': f"INSERT INTO users (email, name, role, password_hash) VALUES ($1, $2, $3, $4) RETURNING {USER_COLUMNS}",
+    'auth_password_hash_by_id': "SELECT password_hash FROM users WHERE id = $1",
+    'auth_set_password': "UPDATE users SET password_hash = $2 WHERE id = $1",
+    'auth_set_email': f"UPDATE users SET email = $2 WHERE id = $1 RETURNING {USER_COLUMNS}",
+
+    # objects
+    'object_by_id': f"""
+        SELECT {OBJECT_WITH_BROKER_COLUMNS}
+        FROM investment_objects o
+        LEFT JOIN users u ON o.broker_id = u.id
+        WHERE o.id = $1
+    """,
+    'object_insert': """
+        INSERT INTO investment_objects (
+            broker_id, title, city, address, property_type, area, price,
+            yield_percent, payback_years, description, images, status, latitude, longitude
+        ) VALUES (
+            $1, $2, $3, $4, $5, $6, $7, $8, $9, $10,
+            ARRAY(SELECT json_array_elements_text($11::json)), $12, $13, $14
+        ) RETURNING id
+    """,
+    'object_update': """
+        UPDATE investment_objects SET
+            title = $2, city = $3, address = $4, property_type = $5, area = $6,
+            price = $7, yield_percent = $8, payback_years = $9, description = $10,
+            images = ARRAY(SELECT json_array_elements_text($11::json)), status = $12,
+            latitude = COALESCE($13, latitude), longitude = COALESCE($14, longitude)
+        WHERE id = $1
+    """,
+    'object_delete': "DELETE FROM investment_objects WHERE id = $1",
+    'objects_delete_by_broker': "DELETE FROM investment_objects WHERE broker_id = $1",
+    'objects_delete_by_ids': "DELETE FROM investment_objects WHERE id = ANY($1)",
+    'objects_calc_inputs': "SELECT id, price, yield_percent, deal_cycle FROM investment_objects WHERE id = ANY($1::int[]) ORDER BY id",
+    'object_view': "UPDATE investment_objects SET views_count = views_count + 1 WHERE id = $1 RETURNING views_count",
+    'objects_sync_state_by_broker': "SELECT id, title, source_key, row_hash FROM investment_objects WHERE broker_id = $1 ORDER BY id",
+
+    # sheet import state
+    'sheet_hashes_all': "SELECT broker_id, content_hash FROM sheet_sync_state",
+    'sheet_hash_upsert': """
+        INSERT INTO sheet_sync_state (broker_id, content_hash, synced_at) VALUES ($1, $2, CURRENT_TIMESTAMP)
+        ON CONFLICT (broker_id) DO UPDATE SET content_hash = EXCLUDED.content_hash, synced_at = EXCLUDED.synced_at
+    """,
+
+    # data versions (read cache and ETag invalidation)
+    'data_versions': "SELECT resource, version FROM data_versions WHERE resource = ANY($1)",
+    'data_version_bump': """
+        INSERT INTO data_versions (resource, version, updated_at) VALUES ($1, 1, CURRENT_TIMESTAMP)
+        ON CONFLICT (resource) DO UPDATE SET version = data_versions.version + 1, updated_at = EXCLUDED.updated_at
+        RETURNING version
+    """,
+
+    # favorites (writes keep investment_objects.favorites_count in step in the same statement)
+    'favorites_by_user': """
+        SELECT f.id, f.user_id, f.object_id, f.created_at,
+               o.id, o.broker_id, o.title, o.city, o.address, o.property_type, o.area, o.price,
+               o.yield_percent, o.description, o.images, o.status, o.created_at
+        FROM favorites f
+        JOIN investment_objects o ON f.object_id = o.id
+        WHERE f.user_id = $1
+        ORDER BY f.created_at DESC
+    """,
+    'favorite_find': "SELECT id FROM favorites WHERE user_id = $1 AND object_id = $2",
+    'favorite_insert': """
+        WITH added AS (
+            INSERT INTO favorites (user_id, object_id) VALUES ($1, $2)
+            ON CONFLICT (user_id, object_id) DO NOTHING
+            RETURNING id, user_id, object_id, created_at
+        ), counted AS (
+            UPDATE investment_objects SET favorites_count = favorites_count + 1
+            WHERE id IN (SELECT object_id FROM added)
+        )
+        SELECT id, user_id, object_id, created_at FROM added
+    """,
+    'favorites_insert_many': """
+        WITH added AS (
+            -- Unknown ids are skipped instead of failing the whole batch on the foreign key
+            INSERT INTO favorites (user_id, object_id)
+            SELECT $1, o.id FROM investment_objects o WHERE o.id = ANY($2::int[])
+            ON CONFLICT (user_id, object_id) DO NOTHING
+            RETURNING object_id
+        ), counted AS (
+            UPDATE investment_objects SET favorites_count = favorites_count + 1
+            WHERE id IN (SELECT object_id FROM added)
+        )
+        SELECT object_id FROM added
+    """,
+    'favorites_delete_many': """
+        WITH removed AS (
+            DELETE FROM favorites WHERE user_id = $1 AND object_id = ANY($2::int[])
+            RETURNING object_id
+        ), counted AS (
+            UPDATE investment_objects SET favorites_count = GREATEST(favorites_count - 1, 0)
+            WHERE id IN (SELECT object_id FROM removed)
+        )
+        SELECT object_id FROM removed
+    """,
+    'favorite_ids_by_user': "SELECT object_id FROM favorites WHERE user_id = $1 ORDER BY object_id",
+    'favorite_ids_in': "SELECT object_id FROM favorites WHERE user_id = $1 AND object_id = ANY($2::int[]) ORDER BY object_id",
+    'favorite_delete': """
+        WITH removed AS (
+            DELETE FROM favorites WHERE id = $1 RETURNING object_id
+        )
+        UPDATE investment_objects SET favorites_count = GREATEST(favorites_count - 1, 0)
+        WHERE id IN (SELECT object_id FROM removed)
+    """,
+    'favorites_delete_by_objects': "DELETE FROM favorites WHERE object_id = ANY($1)",
+
+    # broker investors
+    'investor_insert': f"""
+        INSERT INTO broker_investors (
+            broker_id, first_name, last_name, email, phone, budget, source, stage, notes,
+            strategies, preferred_property_types, preferred_locations
+        )
+        VALUES ($1, $2, $3, $4, $5, $6, $7, $8, $9, $10::text[], $11::text[], $12::text[])
+        RETURNING {INVESTOR_COLUMNS}
+    """,
+    'investor_by_id': f"SELECT {INVESTOR_COLUMNS} FROM broker_investors WHERE id = $1",
+    'investor_delete': "DELETE FROM broker_investors WHERE id = $1",
+
+    # investor timeline: append-only, one row per event
+    'investor_events_append': """
+        INSERT INTO broker_investor_events (investor_id, occurred_at, action, details)
+        SELECT i.id, COALESCE(e.occurred_at::timestamptz, i.created_at, CURRENT_TIMESTAMP), e.action, e.details
+        FROM broker_investors i
+        CROSS JOIN unnest($2::text[], $3::text[], $4::text[]) WITH ORDINALITY AS e(occurred_at, action, details, n)
+        WHERE i.id = $1
+        ORDER BY e.n
+        RETURNING id, occurred_at, action, details
+    """,
+    'investor_events_clear': "DELETE FROM broker_investor_events WHERE investor_id = $1",
+    'investor_events_page': """
+        SELECT id, occurred_at, action, details FROM broker_investor_events
+        WHERE investor_id = $1 AND id < $2
+        ORDER BY id DESC
+        LIMIT $3
+    """,
+
+    # matching
+    'match_investors_by_broker': """
+        SELECT id, budget, strategies, preferred_property_types, preferred_locations
+        FROM broker_investors WHERE broker_id = $1 ORDER BY id
+    """,
+    'match_objects_available': """
+        SELECT id, CASE WHEN min_investment > 0 THEN min_investment ELSE price END,
+               yield_percent, property_type, city, strategy
+        FROM investment_objects WHERE status = 'available' ORDER BY id
+    """,
+}
@@ -1,14 +1,62 @@
+import io
+import re
 import json
 import os
 import base64
 import uuid
+import hashlib
+import time
+import tempfile
+import threading
 import boto3
-from typing import Dict, Any
+from botocore.config import Config
+from botocore.exceptions import ClientError
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from PIL import Image, ImageOps
+from typing import Dict, Any, List, Optional, Union, BinaryIO
+
+S3_ENDPOINT_URL = os.environ.get('S3_ENDPOINT_URL', 'https://bucket.poehali.dev')
+S3_BUCKET = os.environ.get('S3_BUCKET', 'files')
+S3_MAX_POOL_CONNECTIONS = int(os.environ.get('S3_MAX_POOL_CONNECTIONS', '10'))
+
+_s3 = None
+_s3_lock = threading.Lock()
+_s3_init_ms = 0.0
+
+MAX_FILE_SIZE = 50 * 1024 * 1024
+PART_SIZE = 5 * 1024 * 1024
+MAX_PARTS = MAX_FILE_SIZE // PART_SIZE + 1
+
+IMAGE_VARIANTS = {'thumb': 320, 'card': 800, 'full': 1920}
+IMAGE_VARIANT_FORMAT = os.environ.get('IMAGE_VARIANT_FORMAT', 'webp')
+IMAGE_VARIANT_QUALITY = int(os.environ.get('IMAGE_VARIANT_QUALITY', '80'))
+RESIZABLE_TYPES = ('image/jpeg', 'image/jpg', 'image/png', 'image/webp')
+
+_workers = ThreadPoolExecutor(max_workers=int(os.environ.get('UPLOAD_WORKERS', '4')))
+
+KNOWN_KEYS_LIMIT = int(os.environ.get('UPLOAD_KNOWN_KEYS_LIMIT', '10000'))
+_known_keys: 'OrderedDict[str, List[str]]' = OrderedDict()
+_known_keys_lock = threading.Lock()
+SHA256_PATTERN = re.compile(r'^[0-9a-f]{64}$')
+
+TYPE_EXTENSIONS = {
+    'image/jpeg': 'jpg', 'image/jpg': 'jpg', 'image/png': 'png', 'image/gif': 'gif', 'image/webp': 'webp',
+    'video/mp4': 'mp4', 'video/webm': 'webm', 'video/quicktime': 'mov',
+    'application/pdf': 'pdf'
+}
+
+ALLOWED_TYPES = [
+    'image/jpeg', 'image/jpg', 'image/png', 'image/gif', 'image/webp',
+    'video/mp4', 'video/webm', 'video/quicktime',
+    'application/pdf'
+]
 
 def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     '''
-    Business: Загрузка файлов (фото объектов) в S3 хранилище
-    Args: event с httpMethod, body содержащим base64 файл, fileName, fileType
+    Business: Загрузка файлов (фото объектов) в S3 хранилище, целиком или частями (multipart)
+    Args: event с httpMethod, body с action (upload | initiate | part | complete | abort),
+          base64 файлом или частью chunk, fileName, fileType, uploadId, partNumber
     Returns: HTTP response с публичным URL загруженного файла
     '''
     method: str = event.get('httpMethod', 'POST')
@@ -30,6 +78,28 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
         return error_response('Method not allowed', 405)
 
     body = json.loads(event.get('body', '{}'))
+    action = body.get('action', 'upload')
+
+    handlers = {
+        'upload': handle_single_upload,
+        'initiate': handle_initiate,
+        'part': handle_part,
+        'complete': handle_complete,
+        'abort': handle_abort
+    }
+    if action not in handlers:
+        return error_response(f'Unknown action {action}', 400)
+
+    cold = _s3 is None
+    started = time.monotonic()
+    response = handlers[action](body)
+    total_ms = (time.monotonic() - started) * 1000
+    response['headers']['Server-Timing'] = f"s3init;dur={_s3_init_ms if cold else 0:.1f}, total;dur={total_ms:.1f}"
+    response['headers']['Timing-Allow-Origin'] = '*'
+    return response
+
+
+def handle_single_upload(body: Dict[str, Any]) -> Dict[str, Any]:
     file_data = body.get('file')
     file_name = body.get('fileName', 'upload')
     file_type = body.get('fileType', 'image/jpeg')
@@ -37,51 +107,370 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     if not file_data:
         return error_response('File data is required', 400)
 
-    allowed_types = [
-        'image/jpeg', 'image/jpg', 'image/png', 'image/gif', 'image/webp',
-        'video/mp4', 'video/webm', 'video/quicktime',
-        'application/pdf'
-    ]
-
-    if file_type not in allowed_types:
+    if file_type not in ALLOWED_TYPES:
         return error_response(f'File type {file_type} not allowed', 400)
 
     if file_data.startswith('data:'):
-        file_data = file_data.split(',')[1]
-
-    file_bytes = base64.b64decode(file_data)
+        file_data = file_data.split(',', 1)[1]
 
-    max_size = 50 * 1024 * 1024
-    if len(file_bytes) > max_size:
+    if decoded_size(file_data) > MAX_FILE_SIZE:
         return error_response('File size exceeds 50MB limit', 400)
 
-    file_extension = file_name.split('.')[-1].lower() if '.' in file_name else 'jpg'
-    unique_name = f"objects/{uuid.uuid4()}.{file_extension}"
+    file_bytes = base64.b64decode(file_data)
 
-    s3 = boto3.client(
-        's3',
-        endpoint_url='https://bucket.poehali.dev',
-        aws_access_key_id=os.environ['AWS_ACCESS_KEY_ID'],
-        aws_secret_access_key=os.environ['AWS_SECRET_ACCESS_KEY']
-    )
+    unique_name = content_key(hashlib.sha256(file_bytes).hexdigest(), file_type)
+    existing = find_existing(unique_name)
+    if existing is not None:
+        return success_response({
+            'url': cdn_url(unique_name),
+            'fileName': unique_name,
+            'fileType': file_type,
+            'fileSize': len(file_bytes),
+            'variants': variant_urls(unique_name, existing),
+            'deduplicated': True
+        })
 
-    s3.put_object(
-        Bucket='files',
+    # Оригинал пишется последним: его наличие в бакете значит, что копии уже готовы.
+    variants = create_image_variants(unique_name, file_bytes, file_type)
+    s3_client().put_object(
+        Bucket=S3_BUCKET,
         Key=unique_name,
         Body=file_bytes,
-        ContentType=file_type
+        ContentType=file_type,
+        Metadata={'variants': ','.join(variants)}
     )
-
-    cdn_url = f"https://cdn.poehali.dev/projects/{os.environ['AWS_ACCESS_KEY_ID']}/bucket/{unique_name}"
+    remember_key(unique_name, list(variants))
 
     return success_response({
-        'url': cdn_url,
+        'url': cdn_url(unique_name),
         'fileName': unique_name,
         'fileType': file_type,
-        'fileSize': len(file_bytes)
+        'fileSize': len(file_bytes),
+        'variants': variants,
+        'deduplicated': False
+    })
+
+
+def handle_initiate(body: Dict[str, Any]) -> Dict[str, Any]:
+    '''Открывает S3 multipart upload; клиент затем шлёт части по PART_SIZE байт'''
+    file_name = body.get('fileName', 'upload')
+    file_type = body.get('fileType', 'image/jpeg')
+    file_size = int(body.get('fileSize') or 0)
+
+    if file_type not in ALLOWED_TYPES:
+        return error_response(f'File type {file_type} not allowed', 400)
+    if file_size > MAX_FILE_SIZE:
+        return error_response('File size exceeds 50MB limit', 400)
+
+    digest = str(body.get('sha256') or '').lower()
+    metadata = {}
+    if SHA256_PATTERN.match(digest):
+        key = content_key(digest, file_type)
+        existing = find_existing(key)
+        if existing is not None:
+            return success_response({
+                'url': cdn_url(key),
+                'fileName': key,
+                'fileType': file_type,
+                'variants': variant_urls(key, existing),
+                'deduplicated': True
+            })
+        # variants дописываются в метаданные только после того, как копии созданы (publish_staged)
+        metadata = {'sha256': digest}
+        # Части собираются под временным ключом: общий ключ по хешу появляется только после проверки
+        key = staging_key(file_type)
+    else:
+        key = new_object_key(file_name)
+
+    upload = s3_client().create_multipart_upload(Bucket=S3_BUCKET, Key=key, ContentType=file_type, Metadata=metadata)
+
+    return success_response({
+        'uploadId': upload['UploadId'],
+        'fileName': key,
+        'partSize': PART_SIZE,
+        'maxFileSize': MAX_FILE_SIZE
+    })
+
+
+def handle_part(body: Dict[str, Any]) -> Dict[str, Any]:
+    '''Загружает одну часть; лимит размера проверяется по уже принятым частям до записи'''
+    key, upload_id = body.get('fileName'), body.get('uploadId')
+    chunk = body.get('chunk')
+    try:
+        part_number = int(body.get('partNumber'))
+    except (TypeError, ValueError):
+        return error_response('partNumber is required', 400)
+
+    if not valid_upload_ref(key, upload_id) or not chunk:
+        return error_response('fileName, uploadId and chunk are required', 400)
+    if not 1 <= part_number <= MAX_PARTS:
+        return error_response(f'partNumber must be between 1 and {MAX_PARTS}', 400)
+    if decoded_size(chunk) > PART_SIZE:
+        return error_response(f'Part exceeds {PART_SIZE} bytes', 400)
+
+    s3 = s3_client()
+    part_bytes = base64.b64decode(chunk)
+    received = sum(p['Size'] for p in list_parts(s3, key, upload_id) if p['PartNumber'] != part_number)
+    if received + len(part_bytes) > MAX_FILE_SIZE:
+        s3.abort_multipart_upload(Bucket=S3_BUCKET, Key=key, UploadId=upload_id)
+        return error_response('File size exceeds 50MB limit', 413)
+
+    part = s3.upload_part(Bucket=S3_BUCKET, Key=key, UploadId=upload_id,
+                          PartNumber=part_number, Body=part_bytes)
+
+    return success_response({
+        'partNumber': part_number,
+        'etag': part['ETag'],
+        'received': received + len(part_bytes)
+    })
+
+
+def handle_complete(body: Dict[str, Any]) -> Dict[str, Any]:
+    key, upload_id = body.get('fileName'), body.get('uploadId')
+    if not valid_upload_ref(key, upload_id):
+        return error_response('fileName and uploadId are required', 400)
+
+    s3 = s3_client()
+    parts = list_parts(s3, key, upload_id)
+    if not parts:
+        return error_response('No parts uploaded', 400)
+    total = sum(p['Size'] for p in parts)
+    if total > MAX_FILE_SIZE:
+        s3.abort_multipart_upload(Bucket=S3_BUCKET, Key=key, UploadId=upload_id)
+        return error_response('File size exceeds 50MB limit', 413)
+
+    s3.complete_multipart_upload(
+        Bucket=S3_BUCKET, Key=key, UploadId=upload_id,
+        MultipartUpload={'Parts': [{'PartNumber': p['PartNumber'], 'ETag': p['ETag']} for p in parts]}
+    )
+    head = s3.head_object(Bucket=S3_BUCKET, Key=key)
+    file_type = head.get('ContentType')
+    claimed_digest = head.get('Metadata', {}).get('sha256')
+
+    if claimed_digest:
+        return publish_staged(s3, key, file_type, claimed_digest, total)
+
+    variants = {}
+    if file_type in RESIZABLE_TYPES:
+        _, image_file = spool_object(s3, key)
+        with image_file:
+            variants = create_image_variants(key, image_file, file_type)
+
+    return success_response({
+        'url': cdn_url(key),
+        'fileName': key,
+        'fileType': file_type,
+        'fileSize': total,
+        'variants': variants
+    })
+
+
+def publish_staged(s3, staged: str, file_type: str, claimed_digest: str, total: int) -> Dict[str, Any]:
+    '''
+    Проверяет хеш собранного файла и переносит его под общий ключ по sha256, если там
+    ещё пусто. Удаляется только временный ключ, поэтому чужая загрузка с тем же заявленным
+    хешем не может ни перезаписать, ни стереть уже проверенный файл.
+    '''
+    image_file = None
+    try:
+        if file_type in RESIZABLE_TYPES:
+            actual_digest, image_file = spool_object(s3, staged)
+        else:
+            actual_digest = stream_sha256(s3, staged)
+        if actual_digest != claimed_digest:
+            return error_response('Uploaded content does not match sha256', 400)
+
+        key = content_key(claimed_digest, file_type)
+        existing = find_existing(key)
+        if existing is not None:
+            return success_response({
+                'url': cdn_url(key),
+                'fileName': key,
+                'fileType': file_type,
+                'fileSize': total,
+                'variants': variant_urls(key, existing),
+                'deduplicated': True
+            })
+
+        # Копии пишутся до оригинала, как и в handle_single_upload. Проверка и копирование
+        # не атомарны, но при гонке оба файла уже сверены с одним хешем, то есть совпадают.
+        variants = create_image_variants(key, image_file, file_type) if image_file else {}
+        s3.copy_object(Bucket=S3_BUCKET, Key=key, CopySource={'Bucket': S3_BUCKET, 'Key': staged},
+                       ContentType=file_type, MetadataDirective='REPLACE',
+                       Metadata={'sha256': claimed_digest, 'variants': ','.join(variants)})
+        remember_key(key, list(variants))
+    finally:
+        if image_file:
+            image_file.close()
+        s3.delete_object(Bucket=S3_BUCKET, Key=staged)
+
+    return success_response({
+        'url': cdn_url(key),
+        'fileName': key,
+        'fileType': file_type,
+        'fileSize': total,
+        'variants': variants,
+        'deduplicated': False
     })
 
 
+def handle_abort(body: Dict[str, Any]) -> Dict[str, Any]:
+    key, upload_id = body.get('fileName'), body.get('uploadId')
+    if not valid_upload_ref(key, upload_id):
+        return error_response('fileName and uploadId are required', 400)
+    s3_client().abort_multipart_upload(Bucket=S3_BUCKET, Key=key, UploadId=upload_id)
+    return success_response({'message': 'Upload aborted'})
+
+
+def staging_key(file_type: str) -> str:
+    return f"objects/staging/{uuid.uuid4()}.{TYPE_EXTENSIONS.get(file_type, 'bin')}"
+
+
+def content_key(digest: str, file_type: str) -> str:
+    return f"objects/{digest}.{TYPE_EXTENSIONS.get(file_type, 'bin')}"
+
+
+def find_existing(key: str) -> Optional[List[str]]:
+    '''
+    Список готовых копий, если файл с таким ключом уже лежит в бакете, иначе None.
+    Уже виденные ключи отвечают из локального индекса без HEAD-запроса.
+    '''
+    with _known_keys_lock:
+        if key in _known_keys:
+            _known_keys.move_to_end(key)
+            return _known_keys[key]
+    try:
+        head = s3_client().head_object(Bucket=S3_BUCKET, Key=key)
+    except ClientError as e:
+        if e.response.get('Error', {}).get('Code') in ('404', 'NoSuchKey', 'NotFound'):
+            return None
+        raise
+    variants = [name for name in head.get('Metadata', {}).get('variants', '').split(',') if name]
+    remember_key(key, variants)
+    return variants
+
+
+def remember_key(key: str, variants: List[str]) -> None:
+    with _known_keys_lock:
+        _known_keys[key] = variants
+        _known_keys.move_to_end(key)
+        while len(_known_keys) > KNOWN_KEYS_LIMIT:
+            _known_keys.popitem(last=False)
+
+
+def stream_sha256(s3, key: str) -> str:
+    digest = hashlib.sha256()
+    for chunk in s3.get_object(Bucket=S3_BUCKET, Key=key)['Body'].iter_chunks(PART_SIZE):
+        digest.update(chunk)
+    return digest.hexdigest()
+
+
+def spool_object(s3, key: str):
+    '''sha256 и копия объекта во временном файле: в памяти не больше одной части за раз'''
+    digest = hashlib.sha256()
+    spooled = tempfile.SpooledTemporaryFile(max_size=PART_SIZE)
+    for chunk in s3.get_object(Bucket=S3_BUCKET, Key=key)['Body'].iter_chunks(PART_SIZE):
+        digest.update(chunk)
+        spooled.write(chunk)
+    spooled.seek(0)
+    return digest.hexdigest(), spooled
+
+
+def variant_key(key: str, name: str) -> str:
+    return f"{key.rsplit('.', 1)[0]}_{name}.{IMAGE_VARIANT_FORMAT.replace('jpeg', 'jpg')}"
+
+
+def variant_urls(key: str, names: List[str]) -> Dict[str, str]:
+    return {name: cdn_url(variant_key(key, name)) for name in names}
+
+
+def create_image_variants(key: str, image: Union[bytes, BinaryIO], file_type: str) -> Dict[str, str]:
+    '''
+    Уменьшенные копии фото (thumb/card/full) рядом с оригиналом: objects/<id>_<size>.webp.
+    Все размеры кодируются и загружаются параллельно, так что ответ ждёт самый медленный, а не сумму.
+    '''
+    if file_type not in RESIZABLE_TYPES:
+        return {}
+    try:
+        source = ImageOps.exif_transpose(Image.open(io.BytesIO(image) if isinstance(image, bytes) else image))
+        source.load()
+    except (OSError, Image.DecompressionBombError) as e:
+        print(f"Skipping variants for {key}: {e}")
+        return {}
+
+    futures = {name: _workers.submit(store_image_variant, source, key, name, max_side)
+               for name, max_side in IMAGE_VARIANTS.items()}
+    return {name: future.result() for name, future in futures.items()}
+
+
+def store_image_variant(source, key: str, name: str, max_side: int) -> str:
+    image = source.copy()
+    image.thumbnail((max_side, max_side), Image.LANCZOS)
+    if IMAGE_VARIANT_FORMAT == 'jpeg':
+        image = image.convert('RGB')
+    elif image.mode not in ('RGB', 'RGBA'):
+        image = image.convert('RGBA' if 'A' in image.getbands() or 'transparency' in image.info else 'RGB')
+
+    buffer = io.BytesIO()
+    image.save(buffer, format=IMAGE_VARIANT_FORMAT.upper(), quality=IMAGE_VARIANT_QUALITY)
+
+    s3_client().put_object(
+        Bucket=S3_BUCKET,
+        Key=variant_key(key, name),
+        Body=buffer.getvalue(),
+        ContentType=f'image/{IMAGE_VARIANT_FORMAT}',
+        CacheControl='public, max-age=31536000, immutable'
+    )
+    return cdn_url(variant_key(key, name))
+
+
+def list_parts(s3, key: str, upload_id: str) -> List[Dict[str, Any]]:
+    parts = []
+    marker = 0
+    while True:
+        page = s3.list_parts(Bucket=S3_BUCKET, Key=key, UploadId=upload_id, PartNumberMarker=marker)
+        parts.extend(page.get('Parts', []))
+        if not page.get('IsTruncated'):
+            return parts
+        marker = page['NextPartNumberMarker']
+
+
+def decoded_size(data: str) -> int:
+    '''Размер base64-данных после декодирования, без самого декодирования'''
+    return len(data) * 3 // 4 - data[-2:].count('=')
+
+
+def new_object_key(file_name: str) -> str:
+    file_extension = file_name.split('.')[-1].lower() if '.' in file_name else 'jpg'
+    return f"objects/{uuid.uuid4()}.{file_extension}"
+
+
+def valid_upload_ref(key: Optional[str], upload_id: Optional[str]) -> bool:
+    return bool(upload_id) and isinstance(key, str) and key.startswith('objects/') and '..' not in key
+
+
+def s3_client():
+    '''Один клиент S3 (и его пул HTTP-соединений) на тёплый контейнер, создаётся лениво'''
+    global _s3, _s3_init_ms
+    if _s3 is None:
+        with _s3_lock:
+            if _s3 is None:
+                started = time.monotonic()
+                _s3 = boto3.client(
+                    's3',
+                    endpoint_url=S3_ENDPOINT_URL,
+                    aws_access_key_id=os.environ['AWS_ACCESS_KEY_ID'],
+                    aws_secret_access_key=os.environ['AWS_SECRET_ACCESS_KEY'],
+                    config=Config(max_pool_connections=S3_MAX_POOL_CONNECTIONS)
+                )
+                _s3_init_ms = (time.monotonic() - started) * 1000
+    return _s3
+
+
+def cdn_url(key: str) -> str:
+    return f"https://cdn.poehali.dev/projects/{os.environ['AWS_ACCESS_KEY_ID']}/bucket/{key}"
+
+
 def success_response(data: Any, status_code: int = 200) -> Dict[str, Any]:
     return {
         'statusCode': status_code,
@@ -0,0 +1,204 @@
+import os
+import time
+import threading
+import psycopg2
+import psycopg2.errors
+import psycopg2.extensions
+from contextlib import contextmanager
+from typing import Dict, Any, List, Optional, Iterator, Sequence
+from queries import QUERIES
+
+POOL_MAX_SIZE = int(os.environ.get('DB_POOL_MAX_SIZE', '4'))
+POOL_WAIT_TIMEOUT = float(os.environ.get('DB_POOL_WAIT_TIMEOUT', '5'))
+HEALTHCHECK_AFTER_IDLE = float(os.environ.get('DB_POOL_HEALTHCHECK_IDLE', '30'))
+
+
+class PoolExhausted(Exception):
+    pass
+
+
+class PreparingConnection(psycopg2.extensions.connection):
+    '''Connection that remembers which named queries are already PREPAREd in its session'''
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.prepared = set()
+
+
+class ConnectionPool:
+    '''
+    Business: Keeps PostgreSQL connections alive across warm invocations of the function
+    Args: dsn - connection string, max_size - hard cap on open connections
+    Returns: connections via getconn(), which must be given back with putconn()
+    '''
+
+    def __init__(self, dsn: str, max_size: int = POOL_MAX_SIZE):
+        self.dsn = dsn
+        self.max_size = max(1, max_size)
+        self._idle: List[Any] = []
+        self._last_used: Dict[int, float] = {}
+        self._in_use = 0
+        self._cond = threading.Condition()
+        self.stats = {'hits': 0, 'misses': 0, 'reconnects': 0, 'discarded': 0, 'waits': 0}
+
+    def getconn(self):
+        deadline = time.monotonic() + POOL_WAIT_TIMEOUT
+        with self._cond:
+            while True:
+                while self._idle:
+                    conn = self._idle.pop()
+                    if self._is_healthy(conn):
+                        self.stats['hits'] += 1
+                        self._in_use += 1
+                        return conn
+                    self._close(conn)
+                    self.stats['reconnects'] += 1
+                if self._in_use < self.max_size:
+                    self.stats['misses'] += 1
+                    self._in_use += 1
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise PoolExhausted(f'All {self.max_size} database connections are busy')
+                self.stats['waits'] += 1
+                self._cond.wait(remaining)
+
+        try:
+            conn = psycopg2.connect(self.dsn, connection_factory=PreparingConnection)
+            conn.autocommit = True
+        except Exception:
+            with self._cond:
+                self._in_use -= 1
+                self._cond.notify()
+            raise
+        return conn
+
+    def putconn(self, conn, broken: bool = False) -> None:
+        if not broken and not conn.closed:
+            try:
+                if conn.get_transaction_status() != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+                    conn.rollback()
+                if not conn.autocommit:
+                    conn.autocommit = True
+            except psycopg2.Error:
+                broken = True
+
+        with self._cond:
+            self._in_use -= 1
+            if broken or conn.closed or len(self._idle) >= self.max_size:
+                self._close(conn)
+                self.stats['discarded'] += 1
+            else:
+                self._last_used[id(conn)] = time.monotonic()
+                self._idle.append(conn)
+            self._cond.notify()
+
+    def _is_healthy(self, conn) -> bool:
+        if conn.closed:
+            return False
+        if conn.get_transaction_status() == psycopg2.extensions.TRANSACTION_STATUS_UNKNOWN:
+            return False
+        idle_for = time.monotonic() - self._last_used.get(id(conn), 0.0)
+        if idle_for < HEALTHCHECK_AFTER_IDLE:
+            return True
+        try:
+            with conn.cursor() as cur:
+                cur.execute('SELECT 1')
+            return True
+        except psycopg2.Error:
+            return False
+
+    def _close(self, conn) -> None:
+        self._last_used.pop(id(conn), None)
+        try:
+            conn.close()
+        except psycopg2.Error:
+            pass
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._cond:
+            return dict(self.stats, idle=len(self._idle), in_use=self._in_use, max_size=self.max_size)
+
+
+_pool: Optional[ConnectionPool] = None
+_pool_lock = threading.Lock()
+
+
+def get_pool() -> ConnectionPool:
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ConnectionPool(os.environ.get('DATABASE_URL'))
+    return _pool
+
+
+@contextmanager
+def get_connection() -> Iterator[Any]:
+    '''Borrow a pooled autocommit connection; it is returned (or dropped if broken) on exit'''
+    pool = get_pool()
+    conn = pool.getconn()
+    broken = False
+    try:
+        yield conn
+    except (psycopg2.OperationalError, psycopg2.InterfaceError):
+        broken = True
+        raise
+    finally:
+        pool.putconn(conn, broken)
+
+
+@contextmanager
+def transaction(conn) -> Iterator[Any]:
+    '''Run the block as one transaction on a pooled autocommit connection, rolled back on any error'''
+    conn.autocommit = False
+    try:
+        yield conn
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.autocommit = True
+
+
+def pool_stats() -> Dict[str, Any]:
+    if _pool is None:
+        return {'hits': 0, 'misses': 0, 'reconnects': 0, 'discarded': 0, 'waits': 0,
+                'idle': 0, 'in_use': 0, 'max_size': POOL_MAX_SIZE}
+    return _pool.snapshot()
+
+
+def execute(cur, name: str, params: Sequence[Any] = ()) -> None:
+    '''Run a named query from QUERIES as a prepared statement, preparing it once per connection'''
+    conn = cur.connection
+    if name not in conn.prepared:
+        _prepare(cur, name)
+    statement = f"EXECUTE {name} ({', '.join(['%s'] * len(params))})" if params else f"EXECUTE {name}"
+    try:
+        cur.execute(statement, tuple(params))
+    except psycopg2.errors.InvalidSqlStatementName:
+        # The session lost its statements (server-side DISCARD ALL); re-prepare once.
+        conn.prepared.clear()
+        if not conn.autocommit:
+            raise
+        _prepare(cur, name)
+        cur.execute(statement, tuple(params))
+
+
+def _prepare(cur, name: str) -> None:
+    cur.execute(f"PREPARE {name} AS {QUERIES[name]}")
+    cur.connection.prepared.add(name)
+
+
+def data_versions(cur, resources: Sequence[str]) -> Dict[str, int]:
+    '''Current write counters of the given resources; read caches and ETags are keyed by them'''
+    execute(cur, 'data_versions', (list(resources),))
+    found = dict(cur.fetchall())
+    return {resource: found.get(resource, 0) for resource in resources}
+
+
+def bump_data_version(cur, resource: str) -> int:
+    '''Call after (or in the same transaction as) every write to the resource'''
+    execute(cur, 'data_version_bump', (resource,))
+    return cur.fetchone()[0]
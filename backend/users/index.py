@@ -1,19 +1,6 @@
 import json
-import os
-import psycopg2
-from typing import Dict, Any, List, Optional
-
-def escape_sql(value):
-    '''Escape values for Simple Query Protocol'''
-    if value is None:
-        return 'NULL'
-    if isinstance(value, bool):
-        return 'true' if value else 'false'
-    if isinstance(value, (int, float)):
-        return str(value)
-    if isinstance(value, str):
-        return "'" + value.replace("'", "''").replace('\\', '\\\\') + "'"
-    return "'" + str(value).replace("'", "''").replace('\\', '\\\\') + "'"
+from typing import Dict, Any
+from db import get_connection, execute, bump_data_version
 
 def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     '''
@@ -37,15 +24,11 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             'isBase64Encoded': False
         }
     
-    dsn = os.environ.get('DATABASE_URL')
-    conn = psycopg2.connect(dsn)
-    conn.autocommit = True
-    
-    try:
+    with get_connection() as conn:
         cur = conn.cursor()
         
         if method == 'GET':
-            cur.execute("SELECT id, email, name, role FROM users ORDER BY id")
+            execute(cur, 'users_all')
             rows = cur.fetchall()
             users = [{'id': row[0], 'email': row[1], 'name': row[2], 'role': row[3]} for row in rows]
             return {
@@ -69,15 +52,9 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                     'body': json.dumps({'error': 'Email и имя обязательны'})
                 }
             
-            query = f"""
-                INSERT INTO users (email, name, role) 
-                VALUES ({escape_sql(email)}, {escape_sql(name)}, {escape_sql(role)}) 
-                ON CONFLICT (email) 
-                DO UPDATE SET name = EXCLUDED.name, role = EXCLUDED.role 
-                RETURNING id, email, name, role
-            """
-            cur.execute(query)
+            execute(cur, 'user_upsert', (email, name, role))
             row = cur.fetchone()
+            bump_data_version(cur, 'users')
             
             return {
                 'statusCode': 201,
@@ -101,14 +78,9 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                     'body': json.dumps({'error': 'Все поля обязательны'})
                 }
             
-            query = f"""
-                UPDATE users 
-                SET email = {escape_sql(email)}, name = {escape_sql(name)}, role = {escape_sql(role)} 
-                WHERE id = {escape_sql(int(user_id))} 
-                RETURNING id, email, name, role
-            """
-            cur.execute(query)
+            execute(cur, 'user_replace', (int(user_id), email, name, role))
             row = cur.fetchone()
+            bump_data_version(cur, 'users')
             
             if not row:
                 return {
@@ -137,9 +109,9 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                     'body': json.dumps({'error': 'ID пользователя обязателен'})
                 }
             
-            query = f"DELETE FROM users WHERE id = {escape_sql(int(user_id))}"
-            cur.execute(query)
+            execute(cur, 'user_delete', (int(user_id),))
             deleted = cur.rowcount > 0
+            bump_data_version(cur, 'users')
             
             if not deleted:
                 return {
@@ -162,6 +134,3 @@ def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             'isBase64Encoded': False,
             'body': json.dumps({'error': 'Метод не поддерживается'})
         }
-    
-    finally:
-        conn.close()
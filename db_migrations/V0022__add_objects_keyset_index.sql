@@ -0,0 +1,9 @@
+-- Keyset-пагинация каталога по (created_at, id)
+UPDATE t_p80180089_investor_broker_port.investment_objects
+  SET created_at = CURRENT_TIMESTAMP WHERE created_at IS NULL;
+
+ALTER TABLE t_p80180089_investor_broker_port.investment_objects
+  ALTER COLUMN created_at SET NOT NULL;
+
+CREATE INDEX IF NOT EXISTS idx_objects_created_id
+  ON t_p80180089_investor_broker_port.investment_objects(created_at DESC, id DESC);
@@ -0,0 +1,15 @@
+-- Стабильная идентичность импортированных из Google Sheets объектов
+ALTER TABLE t_p80180089_investor_broker_port.investment_objects
+  ADD COLUMN IF NOT EXISTS source_key TEXT NULL,
+  ADD COLUMN IF NOT EXISTS row_hash TEXT NULL;
+
+CREATE UNIQUE INDEX IF NOT EXISTS idx_objects_broker_source_key
+  ON t_p80180089_investor_broker_port.investment_objects(broker_id, source_key)
+  WHERE source_key IS NOT NULL;
+
+-- Хэш содержимого листа брокера на момент последней синхронизации
+CREATE TABLE IF NOT EXISTS t_p80180089_investor_broker_port.sheet_sync_state (
+    broker_id INTEGER PRIMARY KEY REFERENCES t_p80180089_investor_broker_port.users(id),
+    content_hash TEXT NOT NULL,
+    synced_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
@@ -0,0 +1,10 @@
+-- Счётчики версий данных: растут при каждой записи, по ним API сбрасывает кэш чтения
+CREATE TABLE IF NOT EXISTS t_p80180089_investor_broker_port.data_versions (
+    resource TEXT PRIMARY KEY,
+    version BIGINT NOT NULL DEFAULT 0,
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+INSERT INTO t_p80180089_investor_broker_port.data_versions (resource, version)
+VALUES ('objects', 0)
+ON CONFLICT (resource) DO NOTHING;
@@ -0,0 +1,17 @@
+-- Счётчики популярности объекта: число добавлений в избранное и просмотров карточки
+ALTER TABLE t_p80180089_investor_broker_port.investment_objects
+  ADD COLUMN IF NOT EXISTS favorites_count INTEGER NOT NULL DEFAULT 0,
+  ADD COLUMN IF NOT EXISTS views_count INTEGER NOT NULL DEFAULT 0;
+
+UPDATE t_p80180089_investor_broker_port.investment_objects o
+SET favorites_count = f.cnt
+FROM (
+    SELECT object_id, COUNT(*) AS cnt
+    FROM t_p80180089_investor_broker_port.favorites
+    GROUP BY object_id
+) f
+WHERE o.id = f.object_id;
+
+-- Сортировка sort=popular и её keyset-пагинация
+CREATE INDEX IF NOT EXISTS idx_objects_popularity
+  ON t_p80180089_investor_broker_port.investment_objects(favorites_count DESC, views_count DESC, id DESC);
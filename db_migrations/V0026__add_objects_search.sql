@@ -0,0 +1,16 @@
+-- Полнотекстовый поиск по объектам: название (вес A), адрес (B), описание (C)
+ALTER TABLE t_p80180089_investor_broker_port.investment_objects
+  ADD COLUMN IF NOT EXISTS search_vector tsvector GENERATED ALWAYS AS (
+    setweight(to_tsvector('russian', coalesce(title, '')), 'A') ||
+    setweight(to_tsvector('russian', coalesce(address, '')), 'B') ||
+    setweight(to_tsvector('russian', coalesce(description, '')), 'C')
+  ) STORED;
+
+CREATE INDEX IF NOT EXISTS idx_objects_search_vector
+  ON t_p80180089_investor_broker_port.investment_objects USING GIN (search_vector);
+
+-- Нечёткий поиск по адресу (опечатки, части слов) через триграммы
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+
+CREATE INDEX IF NOT EXISTS idx_objects_address_trgm
+  ON t_p80180089_investor_broker_port.investment_objects USING GIN (address gin_trgm_ops);
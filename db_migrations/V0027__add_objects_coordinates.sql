@@ -0,0 +1,18 @@
+-- Координаты объекта для карты: широта/долгота в градусах (WGS 84)
+ALTER TABLE t_p80180089_investor_broker_port.investment_objects
+  ADD COLUMN IF NOT EXISTS latitude DOUBLE PRECISION NULL,
+  ADD COLUMN IF NOT EXISTS longitude DOUBLE PRECISION NULL;
+
+ALTER TABLE t_p80180089_investor_broker_port.investment_objects
+  DROP CONSTRAINT IF EXISTS investment_objects_coordinates_check;
+
+ALTER TABLE t_p80180089_investor_broker_port.investment_objects
+  ADD CONSTRAINT investment_objects_coordinates_check CHECK (
+    (latitude IS NULL AND longitude IS NULL) OR
+    (latitude BETWEEN -90 AND 90 AND longitude BETWEEN -180 AND 180)
+  );
+
+-- Пространственный индекс: выборка по окну карты (bbox) и по радиусу
+CREATE INDEX IF NOT EXISTS idx_objects_location
+  ON t_p80180089_investor_broker_port.investment_objects USING GIST (point(longitude, latitude))
+  WHERE latitude IS NOT NULL;
@@ -0,0 +1,5 @@
+-- Инвестиционный профиль клиента брокера: стратегии, типы недвижимости и города
+ALTER TABLE t_p80180089_investor_broker_port.broker_investors
+  ADD COLUMN IF NOT EXISTS strategies TEXT[] NOT NULL DEFAULT '{}',
+  ADD COLUMN IF NOT EXISTS preferred_property_types TEXT[] NOT NULL DEFAULT '{}',
+  ADD COLUMN IF NOT EXISTS preferred_locations TEXT[] NOT NULL DEFAULT '{}';
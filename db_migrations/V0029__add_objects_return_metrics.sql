@@ -0,0 +1,21 @@
+-- Доходность объекта, считается самой БД при каждой записи (формулы совпадают с backend/api/calculations.py):
+-- срок сделки в месяцах берётся из deal_cycle («18 мес.», «2 года»), по умолчанию 12
+ALTER TABLE t_p80180089_investor_broker_port.investment_objects
+  ADD COLUMN IF NOT EXISTS monthly_income NUMERIC GENERATED ALWAYS AS (
+    round(price * yield_percent / 1200, 2)
+  ) STORED,
+  ADD COLUMN IF NOT EXISTS roi_percent NUMERIC GENERATED ALWAYS AS (
+    round(yield_percent * (
+      CASE WHEN deal_cycle ~ '\d'
+        THEN substring(deal_cycle from '(\d+)')::numeric * CASE WHEN deal_cycle ~* '(год|лет)' THEN 12 ELSE 1 END
+        ELSE 12
+      END
+    ) / 12, 2)
+  ) STORED,
+  ADD COLUMN IF NOT EXISTS payback_months INTEGER GENERATED ALWAYS AS (
+    CASE WHEN yield_percent > 0 THEN ceil(1200 / yield_percent)::integer END
+  ) STORED;
+
+-- sort=roi и фильтр min_roi
+CREATE INDEX IF NOT EXISTS idx_objects_roi
+  ON t_p80180089_investor_broker_port.investment_objects(roi_percent DESC, id DESC);
@@ -0,0 +1,16 @@
+-- Keyset-пагинация по (created_at, id) требует непустой created_at
+UPDATE t_p80180089_investor_broker_port.broker_investors
+  SET created_at = CURRENT_TIMESTAMP WHERE created_at IS NULL;
+
+ALTER TABLE t_p80180089_investor_broker_port.broker_investors
+  ALTER COLUMN created_at SET NOT NULL;
+
+-- Воронка брокера: фильтр по этапу + keyset-пагинация по (created_at, id),
+-- budget в INCLUDE, чтобы суммы по этапам считались index-only scan
+CREATE INDEX IF NOT EXISTS idx_broker_investors_funnel
+  ON t_p80180089_investor_broker_port.broker_investors(broker_id, stage, created_at DESC, id DESC)
+  INCLUDE (budget);
+
+-- Лента без фильтра по этапу
+CREATE INDEX IF NOT EXISTS idx_broker_investors_broker_created
+  ON t_p80180089_investor_broker_port.broker_investors(broker_id, created_at DESC, id DESC);
@@ -0,0 +1,33 @@
+-- История взаимодействий с инвестором: одна строка на событие вместо перезаписи JSONB-массива
+CREATE TABLE IF NOT EXISTS t_p80180089_investor_broker_port.broker_investor_events (
+    id BIGSERIAL PRIMARY KEY,
+    investor_id INTEGER NOT NULL REFERENCES t_p80180089_investor_broker_port.broker_investors(id) ON DELETE CASCADE,
+    occurred_at TIMESTAMPTZ NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    action TEXT NOT NULL DEFAULT '',
+    details TEXT NOT NULL DEFAULT ''
+);
+
+-- Лента события инвестора от новых к старым, keyset по id
+CREATE INDEX IF NOT EXISTS idx_broker_investor_events_investor
+  ON t_p80180089_investor_broker_port.broker_investor_events(investor_id, id DESC);
+
+-- Перенос накопленной истории с сохранением порядка; даты не в ISO-формате заменяются датой создания инвестора
+INSERT INTO t_p80180089_investor_broker_port.broker_investor_events (investor_id, occurred_at, action, details)
+SELECT i.id,
+       CASE WHEN e.event->>'date' ~ '^\d{4}-\d{2}-\d{2}([T ]\d{2}:\d{2}(:\d{2}(\.\d+)?)?)?(Z|[+-]\d{2}(:?\d{2})?)?$'
+            THEN (e.event->>'date')::timestamptz
+            ELSE COALESCE(i.created_at, CURRENT_TIMESTAMP)
+       END,
+       COALESCE(e.event->>'action', ''),
+       COALESCE(e.event->>'details', '')
+FROM t_p80180089_investor_broker_port.broker_investors i
+CROSS JOIN LATERAL jsonb_array_elements(
+  CASE WHEN jsonb_typeof(i.timeline) = 'array' THEN i.timeline ELSE '[]'::jsonb END
+) WITH ORDINALITY AS e(event, n)
+WHERE NOT EXISTS (
+  SELECT 1 FROM t_p80180089_investor_broker_port.broker_investor_events x WHERE x.investor_id = i.id
+)
+ORDER BY i.id, e.n;
+
+-- Колонка timeline больше не пишется API; перенесённые данные остаются в ней до отдельной очистки
+COMMENT ON COLUMN t_p80180089_investor_broker_port.broker_investors.timeline IS 'deprecated: see broker_investor_events';
@@ -106,12 +106,9 @@ const InvestorFunnel = ({ brokerId }: InvestorFunnelProps) => {
   };
 
   const moveToStage = async (investor: BrokerInvestor, newStage: InvestorStage) => {
-    const newTimeline = [
-      ...investor.timeline,
-      { date: new Date().toISOString(), action: 'Смена этапа', details: `Переведён на этап: ${stageLabels[newStage]}` }
-    ];
+    const event = { date: new Date().toISOString(), action: 'Смена этапа', details: `Переведён на этап: ${stageLabels[newStage]}` };
     try {
-      const updated = await api.updateInvestor(Number(investor.id), { stage: newStage, timeline: newTimeline });
+      const updated = await api.updateInvestor(Number(investor.id), { stage: newStage, event });
       setInvestors(prev => prev.map(i => i.id === investor.id ? updated : i));
       setSelectedInvestor(updated);
       toast({ title: 'Этап изменён' });
@@ -121,12 +118,9 @@ const InvestorFunnel = ({ brokerId }: InvestorFunnelProps) => {
   };
 
   const saveNote = async (investor: BrokerInvestor) => {
-    const newTimeline = [
-      ...investor.timeline,
-      { date: new Date().toISOString(), action: 'Добавлена заметка', details: noteDraft }
-    ];
+    const event = { date: new Date().toISOString(), action: 'Добавлена заметка', details: noteDraft };
     try {
-      const updated = await api.updateInvestor(Number(investor.id), { notes: noteDraft, timeline: newTimeline });
+      const updated = await api.updateInvestor(Number(investor.id), { notes: noteDraft, event });
       setInvestors(prev => prev.map(i => i.id === investor.id ? updated : i));
       setSelectedInvestor(updated);
       toast({ title: 'Заметка сохранена' });
@@ -87,7 +87,7 @@ const GoogleSheetsSync = () => {
 
       toast({
         title: 'Синхронизация завершена',
-        description: `Удалено: ${result.total_deleted}, Импортировано: ${result.total_imported} объектов`,
+        description: `Удалено: ${result.total_deleted}, Обновлено: ${result.total_updated ?? 0}, Импортировано: ${result.total_imported} объектов`,
       });
 
       setTimeout(() => {
@@ -6,6 +6,7 @@ import Icon from '@/components/ui/icon';
 import { InvestmentObject, PROPERTY_TYPE_LABELS } from '@/types/investment-object';
 import { useNavigate } from 'react-router-dom';
 import { useAuth } from '@/contexts/AuthContext';
+import { imageVariant } from '@/utils/imageVariants';
 
 interface ObjectCardProps {
   object: InvestmentObject;
@@ -54,7 +55,7 @@ const ObjectCard = ({ object }: ObjectCardProps) => {
     >
       <div className="relative h-48 bg-muted overflow-hidden">
         <img
-          src={object.images[0] || 'https://via.placeholder.com/400x300?text=Объект'}
+          src={imageVariant(object.images[0], 'card') || 'https://via.placeholder.com/400x300?text=Объект'}
           alt={object.title}
           className="w-full h-full object-cover group-hover:scale-105 transition-transform duration-300"
         />
@@ -12,6 +12,7 @@ import { Broker } from '@/types/investment-object';
 import { useObject } from '@/hooks/useObjects';
 import { useFavorites, useAddToFavorites, useRemoveFromFavorites } from '@/hooks/useFavorites';
 import { useAuth } from '@/contexts/AuthContext';
+import { api } from '@/services/api';
 
 const ObjectDetailPage = () => {
   const { id } = useParams<{ id: string }>();
@@ -35,6 +36,12 @@ const ObjectDetailPage = () => {
 
   const isFavorite = favorites.includes(objectId);
 
+  useEffect(() => {
+    if (objectId) {
+      api.recordObjectView(objectId).catch(() => undefined);
+    }
+  }, [objectId]);
+
   useEffect(() => {
     if (object) {
       document.title = `${object.title} - InvestPro`;
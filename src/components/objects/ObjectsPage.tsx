@@ -7,9 +7,36 @@ import Header from '@/components/Header';
 import ObjectsFilters from './ObjectsFilters';
 import ObjectCard from './ObjectCard';
 import { InvestmentObject, ObjectFilters } from '@/types/investment-object';
-import { useObjects } from '@/hooks/useObjects';
+import { useObjectsCatalogue } from '@/hooks/useObjects';
+import { ObjectQuery } from '@/services/api';
 import { useAuth } from '@/contexts/AuthContext';
 
+const PRICE_MAX = 500000000;
+
+// Lowest and highest bound of the selected "a-b" / "a+" ranges; exact ranges are refined on the client
+const rangeEnvelope = (ranges: string[]): [number | undefined, number | undefined] => {
+  if (ranges.length === 0) return [undefined, undefined];
+  const lows = ranges.map(r => parseFloat(r));
+  const highs = ranges.map(r => (r.endsWith('+') ? Infinity : parseFloat(r.split('-')[1])));
+  const low = Math.min(...lows);
+  const high = Math.max(...highs);
+  return [Number.isFinite(low) ? low : undefined, Number.isFinite(high) ? high : undefined];
+};
+
+const toServerQuery = (filters: ObjectFilters): Omit<ObjectQuery, 'cursor'> => {
+  const [minYield, maxYield] = rangeEnvelope(filters.yieldRanges || []);
+  return {
+    q: filters.search?.trim() || undefined,
+    city: filters.cities?.length ? filters.cities.join(',') : undefined,
+    property_type: filters.types?.length ? filters.types.join(',') : undefined,
+    status: filters.status,
+    min_price: filters.priceRange && filters.priceRange[0] > 0 ? filters.priceRange[0] : undefined,
+    max_price: filters.priceRange && filters.priceRange[1] < PRICE_MAX ? filters.priceRange[1] : undefined,
+    min_yield: minYield,
+    max_yield: maxYield,
+  };
+};
+
 const ObjectsPage = () => {
   const navigate = useNavigate();
   const { user } = useAuth();
@@ -29,7 +56,9 @@ const ObjectsPage = () => {
   const [sortBy, setSortBy] = useState('default');
   const [showMobileFilters, setShowMobileFilters] = useState(false);
 
-  const { data: objects = [], isLoading, error } = useObjects();
+  const serverQuery = useMemo(() => toServerQuery(filters), [filters]);
+  const { data, isLoading, error, hasNextPage, fetchNextPage, isFetchingNextPage } = useObjectsCatalogue(serverQuery);
+  const objects = useMemo(() => data?.pages.flatMap(page => page.items) ?? [], [data]);
 
   useEffect(() => {
     document.title = 'Каталог объектов для инвестиций - InvestPro';
@@ -48,31 +77,9 @@ const ObjectsPage = () => {
   };
 
   const filteredObjects = useMemo(() => {
+    // Search, city, type, status, price and the yield envelope are applied by the server (toServerQuery)
     let result = [...objects];
 
-    if (filters.search) {
-      const searchLower = filters.search.toLowerCase();
-      result = result.filter(obj => 
-        obj.title.toLowerCase().includes(searchLower) ||
-        obj.address.toLowerCase().includes(searchLower)
-      );
-    }
-
-    if (filters.cities && filters.cities.length > 0) {
-      result = result.filter(obj => filters.cities.includes(obj.city));
-    }
-
-    if (filters.types && filters.types.length > 0) {
-      result = result.filter(obj => filters.types.includes(obj.type));
-    }
-
-    if (filters.priceRange) {
-      result = result.filter(obj => 
-        obj.price >= filters.priceRange![0] && 
-        obj.price <= filters.priceRange![1]
-      );
-    }
-
     if (filters.yieldRanges && filters.yieldRanges.length > 0) {
       result = result.filter(obj => {
         return filters.yieldRanges!.some(range => {
@@ -332,6 +339,14 @@ const ObjectsPage = () => {
                 ))}
               </div>
             )}
+
+            {hasNextPage && (
+              <div className="flex justify-center mt-8">
+                <Button variant="outline" onClick={() => fetchNextPage()} disabled={isFetchingNextPage}>
+                  {isFetchingNextPage ? 'Загрузка...' : 'Показать ещё'}
+                </Button>
+              </div>
+            )}
           </main>
         </div>
       </div>
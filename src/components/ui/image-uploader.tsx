@@ -2,6 +2,7 @@ import { useState, useRef } from 'react';
 import { Button } from '@/components/ui/button';
 import Icon from '@/components/ui/icon';
 import { api } from '@/services/api';
+import { imageVariant } from '@/utils/imageVariants';
 
 interface ImageUploaderProps {
   images: string[];
@@ -24,7 +25,7 @@ const ImageUploader = ({ images, onChange, maxImages = 10 }: ImageUploaderProps)
       setUploading(i);
       try {
         const result = await api.uploadFile(toUpload[i]);
-        onChange([...images, result.url]);
+        onChange([...images, result.variants?.full ?? result.url]);
       } catch {
         // silent
       }
@@ -43,7 +44,7 @@ const ImageUploader = ({ images, onChange, maxImages = 10 }: ImageUploaderProps)
         <div className="grid grid-cols-3 gap-2">
           {images.map((url, index) => (
             <div key={index} className="relative group aspect-video rounded-md overflow-hidden border">
-              <img src={url} alt="" className="w-full h-full object-cover" />
+              <img src={imageVariant(url, 'thumb')} alt="" className="w-full h-full object-cover" />
               <button
                 type="button"
                 onClick={() => removeImage(index)}
@@ -9,7 +9,7 @@ export const useFavorites = () => {
     queryKey: ['favorites', user?.id],
     queryFn: async () => {
       if (!user) return [];
-      return await api.getFavorites(user.id);
+      return await api.getFavoriteIds(user.id);
     },
     enabled: !!user,
     staleTime: 2 * 60 * 1000,
@@ -1,9 +1,9 @@
-import { useQuery, useMutation, useQueryClient } from '@tanstack/react-query';
-import { api, InvestmentObjectDB, ObjectFilters } from '@/services/api';
+import { useQuery, useInfiniteQuery, useMutation, useQueryClient } from '@tanstack/react-query';
+import { api, InvestmentObjectDB, ObjectQuery } from '@/services/api';
 import { InvestmentObject } from '@/types/InvestmentObject';
 import { convertDBObjectToFrontend } from '@/utils/objectConverter';
 
-export const useObjects = (filters?: ObjectFilters) => {
+export const useObjects = (filters?: ObjectQuery) => {
   return useQuery({
     queryKey: ['objects', filters],
     queryFn: async () => {
@@ -14,6 +14,19 @@ export const useObjects = (filters?: ObjectFilters) => {
   });
 };
 
+export const useObjectsCatalogue = (filters?: Omit<ObjectQuery, 'cursor'>) => {
+  return useInfiniteQuery({
+    queryKey: ['objects', 'pages', filters],
+    queryFn: async ({ pageParam }) => {
+      const page = await api.getObjectsPage({ ...filters, cursor: pageParam });
+      return { items: page.items.map(convertDBObjectToFrontend), nextCursor: page.nextCursor };
+    },
+    initialPageParam: undefined as string | undefined,
+    getNextPageParam: (lastPage) => lastPage.nextCursor ?? undefined,
+    staleTime: 5 * 60 * 1000,
+  });
+};
+
 export const useObject = (id: number) => {
   return useQuery({
     queryKey: ['object', id],
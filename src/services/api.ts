@@ -1,4 +1,44 @@
 const API_URL = 'https://functions.poehali.dev/fc00dc4e-18bf-4893-bb9d-331e8abda973';
+const UPLOAD_URL = 'https://functions.poehali.dev/c8226cd3-1426-487a-8f8f-0b22ed0be84e';
+const UPLOAD_PART_SIZE = 5 * 1024 * 1024;
+
+export interface UploadResult {
+  url: string;
+  fileName: string;
+  fileType: string;
+  variants?: Partial<Record<'thumb' | 'card' | 'full', string>>;
+  deduplicated?: boolean;
+}
+
+const sha256Hex = async (blob: Blob): Promise<string | undefined> => {
+  if (!globalThis.crypto?.subtle) return undefined;
+  const digest = await crypto.subtle.digest('SHA-256', await blob.arrayBuffer());
+  return Array.from(new Uint8Array(digest), (byte) => byte.toString(16).padStart(2, '0')).join('');
+};
+
+const readAsBase64 = (blob: Blob): Promise<string> =>
+  new Promise((resolve, reject) => {
+    const reader = new FileReader();
+    reader.onload = () => resolve((reader.result as string).split(',')[1] ?? '');
+    reader.onerror = reject;
+    reader.readAsDataURL(blob);
+  });
+
+const postUpload = async <T = UploadResult>(
+  body: Record<string, unknown>
+): Promise<T> => {
+  const response = await fetch(UPLOAD_URL, {
+    method: 'POST',
+    headers: { 'Content-Type': 'application/json' },
+    body: JSON.stringify(body)
+  });
+
+  if (!response.ok) {
+    throw new Error('Upload failed');
+  }
+
+  return response.json();
+};
 
 export interface User {
   id: number;
@@ -40,6 +80,11 @@ export interface InvestmentObjectDB {
   status: 'available' | 'reserved' | 'sold';
   created_at?: string;
   broker?: BrokerInfo;
+  latitude?: number | null;
+  longitude?: number | null;
+  monthlyIncome?: number | null;
+  roiPercent?: number | null;
+  paybackMonths?: number | null;
   min_investment?: number;
   monthly_payment?: number;
   strategy?: string;
@@ -73,6 +118,13 @@ export interface Notification {
   created_at?: string;
 }
 
+export interface TimelineEvent {
+  id?: number;
+  date: string;
+  action: string;
+  details: string;
+}
+
 export interface BrokerInvestor {
   id: string;
   brokerId: string;
@@ -86,11 +138,96 @@ export interface BrokerInvestor {
   };
   stage: string;
   interaction: { source: string; notes: string };
-  timeline: { date: string; action: string; details: string }[];
+  timeline: TimelineEvent[];
   portfolio: { totalInvested: number; activeInvestments: number; totalReturn: number; properties: unknown[] };
   metadata: { createdAt: string | null; updatedAt: string | null };
 }
 
+export interface InvestorFilters {
+  stage?: string;
+  source?: string;
+  min_budget?: number;
+  max_budget?: number;
+  limit?: number;
+  cursor?: string;
+  timeline?: 'full' | 'none' | number;
+}
+
+export interface InvestorStageTotals {
+  stages: { stage: string; count: number; budget: number }[];
+  total: { count: number; budget: number };
+}
+
+export interface BatchRequest {
+  resource: string;
+  method?: 'GET' | 'POST' | 'PUT' | 'DELETE';
+  params?: Record<string, string>;
+  body?: Record<string, unknown>;
+}
+
+export interface BatchResult<T = unknown> {
+  status: number;
+  headers: Record<string, string>;
+  body: T | { error: string } | null;
+}
+
+export interface InvestorMatches {
+  investorId: string;
+  matches: { objectId: number; matchScore: number; reasons: string[]; yieldPercent: number }[];
+}
+
+export interface ReturnMetrics {
+  objectId?: number;
+  monthlyIncome: number;
+  totalReturn: number;
+  roiPercent: number;
+  paybackMonths: number | null;
+  termMonths: number;
+}
+
+export type CalculateRequest =
+  | { objectIds: number[]; amount?: number; term_months?: number }
+  | { items: { price: number; yield_percent: number; term_months?: number; deal_cycle?: string; amount?: number }[] };
+
+export interface Page<T> {
+  items: T[];
+  nextCursor: string | null;
+}
+
+export interface ObjectQuery {
+  city?: string;
+  property_type?: string;
+  status?: string;
+  min_price?: number;
+  max_price?: number;
+  min_yield?: number;
+  max_yield?: number;
+  min_roi?: number;
+  broker_city?: string;
+  broker_club?: string;
+  broker_stream?: string;
+  limit?: number;
+  cursor?: string;
+  sort?: 'newest' | 'popular' | 'relevance' | 'roi';
+  q?: string;
+  bbox?: string;
+  lat?: number;
+  lng?: number;
+  radius_km?: number;
+}
+
+const toParams = (filters?: object): Record<string, string> => {
+  const params: Record<string, string> = {};
+  if (filters) {
+    Object.entries(filters).forEach(([key, value]) => {
+      if (value !== undefined && value !== null && value !== '') {
+        params[key] = value.toString();
+      }
+    });
+  }
+  return params;
+};
+
 class ApiClient {
   private baseUrl: string;
 
@@ -128,6 +265,24 @@ class ApiClient {
     return response.json();
   }
 
+  private async requestPage<T>(resource: string, params: Record<string, string>): Promise<Page<T>> {
+    const queryParams = new URLSearchParams({ resource, ...params });
+    const response = await fetch(`${this.baseUrl}?${queryParams}`, {
+      headers: { 'Content-Type': 'application/json' },
+    });
+
+    if (!response.ok) {
+      const error = await response.json();
+      throw new Error(error.error || 'API request failed');
+    }
+
+    return { items: await response.json(), nextCursor: response.headers.get('X-Next-Cursor') };
+  }
+
+  async batch(requests: BatchRequest[]): Promise<BatchResult[]> {
+    return this.request<BatchResult[]>('batch', 'POST', { requests });
+  }
+
   async getUsers(): Promise<User[]> {
     return this.request<User[]>('users', 'GET');
   }
@@ -152,35 +307,22 @@ class ApiClient {
     return this.request<{ message: string }>('users', 'DELETE', undefined, { id: id.toString() });
   }
 
-  async getObjects(filters?: {
-    city?: string;
-    property_type?: string;
-    status?: string;
-    min_price?: number;
-    max_price?: number;
-    min_yield?: number;
-    max_yield?: number;
-    broker_city?: string;
-    broker_club?: string;
-    broker_stream?: string;
-  }): Promise<InvestmentObjectDB[]> {
-    const params: Record<string, string> = {};
-    
-    if (filters) {
-      Object.entries(filters).forEach(([key, value]) => {
-        if (value !== undefined && value !== null) {
-          params[key] = value.toString();
-        }
-      });
-    }
-    
-    return this.request<InvestmentObjectDB[]>('objects', 'GET', undefined, params);
+  async getObjects(filters?: ObjectQuery): Promise<InvestmentObjectDB[]> {
+    return this.request<InvestmentObjectDB[]>('objects', 'GET', undefined, toParams(filters));
+  }
+
+  async getObjectsPage(filters?: ObjectQuery): Promise<Page<InvestmentObjectDB>> {
+    return this.requestPage<InvestmentObjectDB>('objects', toParams(filters));
   }
 
   async getObjectById(id: number): Promise<InvestmentObjectDB> {
     return this.request<InvestmentObjectDB>('objects', 'GET', undefined, { id: id.toString() });
   }
 
+  async recordObjectView(id: number): Promise<{ viewsCount: number }> {
+    return this.request<{ viewsCount: number }>('objects', 'POST', undefined, { action: 'view', id: id.toString() });
+  }
+
   async createObject(data: Omit<InvestmentObjectDB, 'id' | 'created_at'>): Promise<InvestmentObjectDB> {
     return this.request<InvestmentObjectDB>('objects', 'POST', data);
   }
@@ -190,17 +332,31 @@ class ApiClient {
   }
 
   async getFavorites(userId: number): Promise<Favorite[]> {
-    return this.request<Favorite[]>('favorites', 'GET', undefined, { user_id: userId.toString() });
+    return this.request<Favorite[]>('favorites', 'GET', undefined, { userId: userId.toString() });
+  }
+
+  async getFavoriteIds(userId: number, objectIds?: number[]): Promise<number[]> {
+    const params: Record<string, string> = { userId: userId.toString(), view: 'ids' };
+    if (objectIds?.length) params.objectIds = objectIds.join(',');
+    return this.request<number[]>('favorites', 'GET', undefined, params);
   }
 
   async addToFavorites(userId: number, objectId: number): Promise<Favorite> {
-    return this.request<Favorite>('favorites', 'POST', { user_id: userId, object_id: objectId });
+    return this.request<Favorite>('favorites', 'POST', { userId, objectId });
+  }
+
+  async addManyToFavorites(userId: number, objectIds: number[]): Promise<{ added: number[] }> {
+    return this.request<{ added: number[] }>('favorites', 'POST', { userId, objectIds });
   }
 
-  async removeFromFavorites(userId: number, objectId: number): Promise<{ message: string }> {
-    return this.request<{ message: string }>('favorites', 'DELETE', undefined, {
-      user_id: userId.toString(),
-      object_id: objectId.toString(),
+  async removeFromFavorites(userId: number, objectId: number): Promise<{ removed: number[] }> {
+    return this.removeManyFromFavorites(userId, [objectId]);
+  }
+
+  async removeManyFromFavorites(userId: number, objectIds: number[]): Promise<{ removed: number[] }> {
+    return this.request<{ removed: number[] }>('favorites', 'DELETE', undefined, {
+      userId: userId.toString(),
+      objectIds: objectIds.join(','),
     });
   }
 
@@ -216,8 +372,48 @@ class ApiClient {
     return this.request<Notification>('notifications', 'POST', data);
   }
 
-  async getInvestors(brokerId: number): Promise<BrokerInvestor[]> {
-    return this.request<BrokerInvestor[]>('investors', 'GET', undefined, { broker_id: brokerId.toString() });
+  async getInvestors(brokerId: number, filters?: InvestorFilters): Promise<BrokerInvestor[]> {
+    const params: Record<string, string> = { broker_id: brokerId.toString() };
+    if (filters) {
+      Object.entries(filters).forEach(([key, value]) => {
+        if (value !== undefined && value !== null) {
+          params[key] = value.toString();
+        }
+      });
+    }
+    return this.request<BrokerInvestor[]>('investors', 'GET', undefined, params);
+  }
+
+  async getInvestorsPage(brokerId: number, filters?: InvestorFilters): Promise<Page<BrokerInvestor>> {
+    return this.requestPage<BrokerInvestor>('investors', {
+      broker_id: brokerId.toString(),
+      limit: '100',
+      ...toParams(filters),
+    });
+  }
+
+  async getInvestorStageTotals(brokerId: number, filters?: Omit<InvestorFilters, 'limit' | 'cursor' | 'timeline'>): Promise<InvestorStageTotals> {
+    const params: Record<string, string> = { broker_id: brokerId.toString(), view: 'stages' };
+    if (filters) {
+      Object.entries(filters).forEach(([key, value]) => {
+        if (value !== undefined && value !== null) {
+          params[key] = value.toString();
+        }
+      });
+    }
+    return this.request<InvestorStageTotals>('investors', 'GET', undefined, params);
+  }
+
+  async getMatches(brokerId: number, options?: { investorId?: number; topK?: number; minScore?: number }): Promise<InvestorMatches[]> {
+    const params: Record<string, string> = { broker_id: brokerId.toString() };
+    if (options?.investorId) params.investor_id = options.investorId.toString();
+    if (options?.topK) params.top_k = options.topK.toString();
+    if (options?.minScore !== undefined) params.min_score = options.minScore.toString();
+    return this.request<InvestorMatches[]>('matches', 'GET', undefined, params);
+  }
+
+  async calculateReturns(data: CalculateRequest): Promise<ReturnMetrics[]> {
+    return this.request<ReturnMetrics[]>('calculate', 'POST', data);
   }
 
   async createInvestor(data: {
@@ -231,6 +427,9 @@ class ApiClient {
     stage?: string;
     notes?: string;
     timeline?: unknown[];
+    strategies?: string[];
+    preferred_property_types?: string[];
+    preferred_locations?: string[];
   }): Promise<BrokerInvestor> {
     return this.request<BrokerInvestor>('investors', 'POST', data);
   }
@@ -239,40 +438,63 @@ class ApiClient {
     return this.request<BrokerInvestor>('investors', 'PUT', { id, ...data });
   }
 
+  async addInvestorEvent(investorId: number, event: { action: string; details: string; date?: string }): Promise<TimelineEvent> {
+    return this.request<TimelineEvent>('investors', 'POST', { investor_id: investorId, ...event }, { action: 'event' });
+  }
+
+  async getInvestorTimeline(brokerId: number, investorId: number, options?: { limit?: number; cursor?: string }): Promise<TimelineEvent[]> {
+    const params: Record<string, string> = { broker_id: brokerId.toString(), view: 'timeline', id: investorId.toString() };
+    if (options?.limit) params.limit = options.limit.toString();
+    if (options?.cursor) params.cursor = options.cursor;
+    return this.request<TimelineEvent[]>('investors', 'GET', undefined, params);
+  }
+
   async deleteInvestor(id: number): Promise<{ message: string }> {
     return this.request<{ message: string }>('investors', 'DELETE', undefined, { id: id.toString() });
   }
 
-  async uploadFile(file: File): Promise<{ url: string; fileName: string; fileType: string }> {
-    return new Promise((resolve, reject) => {
-      const reader = new FileReader();
-      reader.onload = async () => {
-        try {
-          const base64Data = reader.result as string;
-          const response = await fetch('https://functions.poehali.dev/c8226cd3-1426-487a-8f8f-0b22ed0be84e', {
-            method: 'POST',
-            headers: { 'Content-Type': 'application/json' },
-            body: JSON.stringify({
-              file: base64Data,
-              fileName: file.name,
-              fileType: file.type
-            })
-          });
-          
-          if (!response.ok) {
-            throw new Error('Upload failed');
-          }
-          
-          const data = await response.json();
-          resolve(data);
-        } catch (error) {
-          reject(error);
-        }
-      };
-      reader.onerror = reject;
-      reader.readAsDataURL(file);
+  async uploadFile(file: File): Promise<UploadResult> {
+    if (file.size > UPLOAD_PART_SIZE) {
+      return this.uploadFileInParts(file);
+    }
+
+    const base64Data = await readAsBase64(file);
+    return postUpload({
+      file: base64Data,
+      fileName: file.name,
+      fileType: file.type
     });
   }
+
+  private async uploadFileInParts(file: File): Promise<UploadResult> {
+    const upload = await postUpload<UploadResult & { uploadId: string; partSize: number }>({
+      action: 'initiate',
+      fileName: file.name,
+      fileType: file.type,
+      fileSize: file.size,
+      sha256: await sha256Hex(file)
+    });
+    if (upload.deduplicated) {
+      return upload;
+    }
+
+    try {
+      for (let offset = 0, partNumber = 1; offset < file.size; offset += upload.partSize, partNumber++) {
+        const chunk = await readAsBase64(file.slice(offset, offset + upload.partSize));
+        await postUpload({
+          action: 'part',
+          fileName: upload.fileName,
+          uploadId: upload.uploadId,
+          partNumber,
+          chunk
+        });
+      }
+      return await postUpload({ action: 'complete', fileName: upload.fileName, uploadId: upload.uploadId });
+    } catch (error) {
+      await postUpload({ action: 'abort', fileName: upload.fileName, uploadId: upload.uploadId }).catch(() => undefined);
+      throw error;
+    }
+  }
 }
 
 export const api = new ApiClient(API_URL);
\ No newline at end of file
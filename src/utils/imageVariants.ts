@@ -0,0 +1,8 @@
+export type ImageVariant = 'thumb' | 'card' | 'full';
+
+const VARIANT_PATTERN = /_(thumb|card|full)\.(webp|jpg)$/;
+
+export const imageVariant = (url: string | undefined, size: ImageVariant): string | undefined => {
+  if (!url || !VARIANT_PATTERN.test(url)) return url;
+  return url.replace(VARIANT_PATTERN, `_${size}.$2`);
+};